@@ -0,0 +1,80 @@
+""" End-to-end benchmark of a full 18-trial session, headless.
+
+A recorded pen stream is replayed through ExperimentSession on SDL's dummy video
+driver, optionally accelerated, and the frame-time distribution, sample throughput
+and trial save latency are reported.
+
+    python benchmark_session.py [--replay P1/recording_trial_1_....json] [--speed 1] [--trial-duration 30] [--json out.json]
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+from time import perf_counter
+import numpy as np
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0: return {}
+    return {"mean": float(values.mean()), "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)), "p99": float(np.percentile(values, 99)),
+            "max": float(values.max())}
+
+
+def run_benchmark(replay_file, speed=1.0, trial_duration=30.0, size=(3200, 2000), out_dir=None):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from replay_input import ReplayInput, ScaledClock
+    from run_experiment import ExperimentSession
+
+    pygame.init()
+    screen = pygame.display.set_mode(size)
+    clock = ScaledClock(speed)
+    device = ReplayInput(replay_file, clock=clock)
+    out_dir = out_dir or tempfile.mkdtemp(prefix="session_benchmark_")
+    session = ExperimentSession(screen, device, out_dir, trial_duration=trial_duration, clock=clock, auto_start=True)
+    start = perf_counter()
+    session.run()
+    wall = perf_counter() - start
+    pygame.quit()
+
+    intervals = np.concatenate([np.diff(t["frame_starts"]) for t in session.trial_timings]) * 1000
+    render = np.concatenate([t["render_times"] for t in session.trial_timings]) * 1000
+    flip = np.concatenate([t["flip_times"] for t in session.trial_timings]) * 1000
+    return {
+        "trials": len(session.trial_timings),
+        "speed": speed,
+        "wall_time_s": wall,
+        "frame_interval_ms": percentiles(intervals),
+        "target_frame_interval_ms": 1000 / (60 * speed),
+        "render_ms": percentiles(render),
+        "flip_ms": percentiles(flip),
+        "missed_frames": int(sum(t["missed"] for t in session.trial_timings)),
+        "samples": device.replayed,
+        "samples_per_s": device.replayed / wall,
+        "save_latency_ms": percentiles([latency * 1000 for _, latency in session.writer.saved]),
+        "save_failures": len(session.save_errors),
+        "output_dir": out_dir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replay", help="recorded trial to replay (default: first P*/recording_trial*.json)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor; frame timings are only representative at 1")
+    parser.add_argument("--trial-duration", type=float, default=30.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    replay_file = args.replay or sorted(glob.glob("P[0-9]*/recording_trial*.json"))[0]
+    report = run_benchmark(replay_file, speed=args.speed, trial_duration=args.trial_duration)
+    print(json.dumps(report, indent=1))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
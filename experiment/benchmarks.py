@@ -0,0 +1,565 @@
+""" Timing and memory benchmarks of the trajectory_analysis and util hot paths.
+
+Every case is run on traces of 10^3 to 10^7 samples, from a synthetic ellipse and
+from a recorded pen trace tiled back and forth to the requested length. The fastest
+of a few runs is reported with the peak memory of one run, as seen by tracemalloc.
+Results are saved as JSON and can be compared to an earlier baseline, flagging cases
+that became slower or larger than the tolerance allows.
+
+Fast paths are checked against the implementation they replace by the agreement
+checks registered in AGREEMENT_CHECKS; --check runs them all.
+
+    python benchmarks.py [--sizes 1e3 1e4 1e5] [--cases NAME ...] [--save baseline.json]
+    python benchmarks.py --compare baseline.json [--tolerance 1.3]
+    python benchmarks.py --check
+    python benchmarks.py --derivatives     # accuracy of the spline, savgol and diff backends
+"""
+import argparse
+import glob
+import json
+import platform
+import sys
+import tracemalloc
+from time import perf_counter
+import numpy as np
+import scipy
+import scipy.stats as stats
+import util
+from bootstrap import block_bootstrap, draw_blocks
+from chunked import process_chunked
+from trajectory_analysis import Trajectory, TrajectoryBatch, fit_power_laws
+from trials import load_pen
+
+DT = 0.005
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+SOURCES = ("ellipse", "pen")
+
+
+def ellipse(n, ra=10.0, rb=5.0, freq=0.5, dt=DT):
+    """Ellipse traced at constant angular speed, n samples every dt seconds"""
+    t = np.arange(n) * dt
+    return ra * np.cos(2 * np.pi * freq * t), rb * np.sin(2 * np.pi * freq * t), t
+
+
+def tiled(x, y, t, n):
+    """A recorded trace extended to n samples by running it forward and backward in turn;
+       positions and sampling intervals stay continuous at the turns"""
+    m = len(t)
+    k = np.arange(n) % (2 * m - 2)
+    i = m - 1 - np.abs(k - (m - 1))
+    ts = t[0] + np.concatenate(([0.0], np.cumsum(np.abs(np.diff(t[i])))))
+    return x[i], y[i], ts
+
+
+def pen_trace(filename=None):
+    filename = filename or sorted(glob.glob("P[0-9]*/recording_trial*.json"))[0]
+    return load_pen(filename)
+
+
+def make_trace(source, n, pen=None):
+    if source == "ellipse": return ellipse(n)
+    return tiled(*(pen or pen_trace()), n)
+
+
+# Each case takes a trace (x, y, t) and returns the function to time, after any setup
+# that should not be timed. max_n caps the sizes a case runs at by default.
+CASES = {}
+
+
+def case(name, max_n=None):
+    def register(setup):
+        CASES[name] = (setup, max_n)
+        return setup
+    return register
+
+
+@case("Trajectory.__init__")
+def _init(x, y, t):
+    return lambda: Trajectory(x, y, t, dt=DT)
+
+
+@case("Trajectory.butterworth_filter")
+def _filter(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT)
+    return lambda: tr.filtered(10)
+
+
+@case("Trajectory.calc_betas")
+def _calc_betas(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT, smooth=10)
+    def run():
+        tr.forget_derived()
+        tr.calc_betas(rlim=[0.5, 80])
+    return run
+
+
+@case("Trajectory.calc_betas savgol")
+def _calc_betas_savgol(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT, smooth=10, derivative="savgol")
+    def run():
+        tr.forget_derived()
+        tr.calc_betas(rlim=[0.5, 80])
+    return run
+
+
+@case("Trajectory.calc_betas diff")
+def _calc_betas_diff(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT, smooth=10, derivative="diff")
+    def run():
+        tr.forget_derived()
+        tr.calc_betas(rlim=[0.5, 80])
+    return run
+
+
+@case("Trajectory.calc_betas orthogonal")
+def _calc_betas_odr(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT, smooth=10)
+    def run():
+        tr.forget_derived()
+        tr.calc_betas(rlim=[0.5, 80], orthogonal=True)
+    return run
+
+
+@case("Trajectory.retrack")
+def _retrack(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT, smooth=10)
+    tr.C
+    return lambda: tr.retrack(target_betaCV=-1/3)
+
+
+@case("Trajectory.windowed_betas")
+def _windowed_betas(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT, smooth=10)
+    tr.logs
+    return lambda: tr.windowed_betas(5.0, rlim=[0.5, 80])
+
+
+@case("Trajectory.cycle_betas")
+def _cycle_betas(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT, smooth=10)
+    tr.logs
+    return lambda: tr.cycle_betas(rlim=[0.5, 80])
+
+
+@case("Trajectory.retrack_batch 16 betas")
+def _retrack_batch(x, y, t):
+    tr = Trajectory(x, y, t, dt=DT, smooth=10)
+    tr.C
+    return lambda: tr.retrack_batch(target_betaCV=np.linspace(-1, 0, 16))
+
+
+@case("chunked.process_chunked")
+def _process_chunked(x, y, t):
+    return lambda: process_chunked(x, y, t, DT, smooth=10, cut=[5, 2], rlim=[0.5, 80], chunk=100000)
+
+
+@case("util.resample")
+def _resample(x, y, t):
+    return lambda: util.resample(t, x, new_dt=DT, smooth=10, cut=[1, 1])
+
+
+@case("util.orthogonal_regression")
+def _orthogonal_regression(x, y, t):
+    fit = Trajectory(x, y, t, dt=DT, smooth=10).fit(rlim=[0.5, 80])
+    return lambda: util.orthogonal_regression(fit.logC, fit.logV)
+
+
+@case("util.odr_regression", max_n=10**5)
+def _odr_regression(x, y, t):
+    fit = Trajectory(x, y, t, dt=DT, smooth=10).fit(rlim=[0.5, 80])
+    return lambda: util.odr_regression(fit.logC, fit.logV)
+
+
+@case("bootstrap.block_bootstrap 2000 replicates")
+def _block_bootstrap(x, y, t):
+    fit = Trajectory(x, y, t, dt=DT, smooth=10).fit(rlim=[0.5, 80])
+    return lambda: block_bootstrap(fit.logC, fit.logV, 400, 2000, seed=0)
+
+
+def time_call(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return times
+
+
+def peak_memory(func):
+    """Peak memory in bytes traced while func runs, above what was allocated before"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - base
+
+
+def run_case(name, source, n, repeat=3, pen=None):
+    setup, _ = CASES[name]
+    func = setup(*make_trace(source, n, pen))
+    times = time_call(func, repeat if n < 10**6 else 1)
+    return {"case": name, "source": source, "n": n,
+            "time_s": min(times), "time_median_s": float(np.median(times)), "runs": len(times),
+            "peak_mb": peak_memory(func) / 2**20}
+
+
+def run(cases=None, sources=SOURCES, sizes=SIZES, repeat=3, pen_file=None, limits=True, log=print):
+    pen = pen_trace(pen_file) if "pen" in sources else None
+    results = []
+    for name in cases or CASES:
+        max_n = CASES[name][1]
+        for source in sources:
+            for n in sizes:
+                if limits and max_n and n > max_n: continue
+                row = run_case(name, source, n, repeat, pen)
+                log(f"{name:36s} {source:8s} {n:>9d} {row['time_s'] * 1000:10.2f} ms {row['peak_mb']:9.1f} MB")
+                results.append(row)
+    return results
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "system": platform.system()}
+
+
+def compare(results, baseline, tolerance=1.3):
+    """Rows whose time or peak memory grew by more than tolerance times the baseline"""
+    before = {(r["case"], r["source"], r["n"]): r for r in baseline["results"]}
+    regressions = []
+    for row in results:
+        old = before.get((row["case"], row["source"], row["n"]))
+        if old is None: continue
+        for key in ("time_s", "peak_mb"):
+            if old[key] > 0 and row[key] > tolerance * old[key]:
+                regressions.append({"case": row["case"], "source": row["source"], "n": row["n"],
+                                    "measure": key, "baseline": old[key], "now": row[key],
+                                    "ratio": row[key] / old[key]})
+    return regressions
+
+
+# Agreement checks: each returns the largest differences between a fast path and the
+# implementation it replaces, checked against the given absolute tolerance.
+AGREEMENT_CHECKS = {}
+
+
+def agreement(name, tolerance):
+    def register(check):
+        AGREEMENT_CHECKS[name] = (check, tolerance)
+        return check
+    return register
+
+
+def max_difference(a, b):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if a.shape != b.shape: return np.inf
+    both = np.isnan(a) & np.isnan(b)
+    return float(np.max(np.abs(np.where(both, 0.0, a - b)), initial=0.0))
+
+
+def noisy_ellipses(count=4, seed=0):
+    """Ellipse traces of different lengths with a little positional noise"""
+    rng = np.random.default_rng(seed)
+    traces = []
+    for i in range(count):
+        x, y, t = ellipse(2000 + 500 * i, ra=8 + i, rb=4 + i / 2, freq=0.3 + 0.2 * i)
+        traces.append((x + 0.01 * rng.standard_normal(len(x)), y + 0.01 * rng.standard_normal(len(y)), t))
+    return traces
+
+
+def baseline_calc_betas(C, V, A, R, t, rlim=None):
+    """The original in-place Trajectory.calc_betas (OLS), on the full kinematic arrays"""
+    filt = np.isfinite(C) & np.isfinite(A) & np.isfinite(V) & np.isfinite(R)
+    if rlim:
+        rmin, rmax = rlim
+        filt = filt & (R < rmax) & (R > rmin)
+    out = {"C": C[filt], "V": V[filt], "A": A[filt], "R": R[filt], "tf": t[filt]}
+    out["logC"], out["logV"] = np.log10(out["C"]), np.log10(out["V"])
+    out["logA"], out["logR"] = np.log10(out["A"]), np.log10(out["R"])
+    for pair, x, y in (("CA", "logC", "logA"), ("CV", "logC", "logV"), ("RV", "logR", "logV")):
+        beta, offset, r, p_v, std_err = stats.linregress(out[x], out[y])
+        out["beta" + pair], out["offset" + pair], out["r2" + pair] = beta, offset, r ** 2
+    return out
+
+
+@agreement("Trajectory.fit and calc_betas vs the original calc_betas", 1e-12)
+def _fit_vs_calc_betas():
+    x, y, t = pen_trace()
+    tr = Trajectory(x, y, t, dt=DT, smooth=10, cut=[5, 2])
+    reference = baseline_calc_betas(tr.C, tr.V, tr.A, tr.R, tr.t, rlim=[0.5, 80])
+    full_ds = tr.V * DT
+    fit = tr.fit(rlim=[0.5, 80])
+    tr.calc_betas(rlim=[0.5, 80])
+    diffs = {}
+    for name in ("betaCA", "offsetCA", "r2CA", "betaCV", "offsetCV", "r2CV", "betaRV", "offsetRV", "r2RV", "logC", "logV"):
+        diffs["fit " + name] = max_difference(getattr(fit, name), reference[name])
+    for name in ("betaCA", "r2CA", "betaCV", "r2CV", "betaRV", "r2RV", "logC", "logA", "C", "V", "A", "R", "tf"):
+        diffs["calc_betas " + name] = max_difference(getattr(tr, name), reference[name])
+    # derived after the fit, but still over all samples as in the original
+    diffs["calc_betas ds"] = max_difference(tr.ds, full_ds)
+    return diffs
+
+
+@agreement("util.batch_linregress vs stats.linregress", 1e-10)
+def _batch_linregress():
+    traces = [Trajectory(x, y, t, dt=DT, smooth=10).fit(rlim=[0.5, 80]) for x, y, t in noisy_ellipses()]
+    width = max(len(f.logC) for f in traces)
+    X = np.full((len(traces), width), np.nan)
+    Y = np.full((len(traces), width), np.nan)
+    for i, f in enumerate(traces):
+        X[i, :len(f.logC)] = f.logC
+        Y[i, :len(f.logV)] = f.logV
+    beta, offset, r2 = util.batch_linregress(X, Y)
+    reference = np.array([stats.linregress(f.logC, f.logV)[:3] for f in traces])
+    return {"beta": max_difference(beta, reference[:, 0]), "offset": max_difference(offset, reference[:, 1]),
+            "r2": max_difference(r2, reference[:, 2] ** 2)}
+
+
+@agreement("util.orthogonal_regression vs scipy.odr", 1e-4)
+def _tls_vs_odr():
+    # ODR stops at its sum of squares tolerance, leaving betas off by ~1e-5 from the exact minimum
+    fits = [Trajectory(x, y, t, dt=DT, smooth=10).fit(rlim=[0.5, 80]) for x, y, t in noisy_ellipses()]
+    fits.append(Trajectory(*pen_trace(), dt=DT, smooth=10, cut=[5, 2]).fit(rlim=[0.5, 80]))
+    diffs = {}
+    for f in fits:
+        for x, y in ((f.logC, f.logA), (f.logC, f.logV), (f.logR, f.logV)):
+            tls, odr = util.orthogonal_regression(x, y), util.odr_regression(x, y)
+            for name in ("beta", "offset", "r2"):
+                diffs[name] = max(diffs.get(name, 0.0), max_difference(tls[name], odr[name]))
+    return diffs
+
+
+@agreement("TrajectoryBatch vs Trajectory", 1e-8)
+def _batch_vs_trajectory():
+    traces = noisy_ellipses()
+    batch = TrajectoryBatch([x for x, _, _ in traces], [y for _, y, _ in traces], dt=DT, smooth=10, cut=[1, 1])
+    batch.calc_betas(rlim=[0.5, 80])
+    diffs = {}
+    for i, (x, y, t) in enumerate(traces):
+        tr = Trajectory(x, y, t, dt=DT, smooth=10, cut=[1, 1])
+        fit = tr.fit(rlim=[0.5, 80])
+        n = batch.lengths[i]
+        for name in ("V", "C", "A"):
+            scale = np.max(np.abs(getattr(tr, name)))
+            diffs[name] = max(diffs.get(name, 0.0), max_difference(getattr(batch, name)[i, :n] / scale, getattr(tr, name) / scale))
+        for name in ("betaCA", "betaCV", "r2CV"):
+            diffs[name] = max(diffs.get(name, 0.0), max_difference(getattr(batch, name)[i], getattr(fit, name)))
+    batch.calc_betas(rlim=[0.5, 80], orthogonal=True)
+    for i, (x, y, t) in enumerate(traces):
+        fit = Trajectory(x, y, t, dt=DT, smooth=10, cut=[1, 1]).fit(rlim=[0.5, 80], orthogonal=True)
+        for name in ("betaCA", "betaCV", "r2CV"):
+            diffs[name + " orthogonal"] = max(diffs.get(name + " orthogonal", 0.0), max_difference(getattr(batch, name)[i], getattr(fit, name)))
+    return diffs
+
+
+@agreement("Trajectory.windowed_betas vs fit of each window", 1e-10)
+def _windowed_vs_fit():
+    tr = Trajectory(*pen_trace(), dt=DT, smooth=10, cut=[5, 2])
+    diffs = {}
+    for orthogonal in (False, True):
+        windowed = tr.windowed_betas(5.0, 0.5, rlim=[0.5, 80], orthogonal=orthogonal)
+        for i in range(len(windowed.t)):
+            window = slice(i * 100, i * 100 + 1000)
+            fit = fit_power_laws({k: v[window] for k, v in tr.logs.items()}, rlim=[0.5, 80], orthogonal=orthogonal)
+            for name in ("betaCA", "offsetCA", "r2CA", "betaCV", "offsetCV", "r2CV", "betaRV", "r2RV"):
+                diffs[name] = max(diffs.get(name, 0.0), max_difference(getattr(windowed, name)[i], getattr(fit, name)))
+    return diffs
+
+
+@agreement("Trajectory.cycle_betas vs fit of each cycle", 1e-10)
+def _cycles_vs_fit():
+    tr = Trajectory(*ellipse(4000, freq=1.2), dt=DT, smooth=10)
+    diffs = {}
+    for freq in (None, 1.2):
+        cycles = tr.cycle_betas(freq=freq, rlim=[0.5, 80])
+        for i, (start, stop) in enumerate(zip(cycles.start, cycles.stop)):
+            cycle = slice(start, stop)
+            fit = fit_power_laws({k: v[cycle] for k, v in tr.logs.items()}, rlim=[0.5, 80])
+            for name in ("betaCA", "r2CA", "betaCV", "offsetCV", "r2CV"):
+                diffs[name] = max(diffs.get(name, 0.0), max_difference(getattr(cycles, name)[i], getattr(fit, name)))
+            diffs["length"] = max(diffs.get("length", 0.0), max_difference(cycles.length[i], tr.ds[cycle].sum()))
+            diffs["period"] = max(diffs.get("period", 0.0), max_difference(cycles.period[i], tr.t[stop] - tr.t[start]))
+    return diffs
+
+
+@agreement("TrajectoryBatch.windowed_betas vs Trajectory.windowed_betas", 1e-8)
+def _batch_windowed_vs_trajectory():
+    traces = noisy_ellipses()
+    batch = TrajectoryBatch([x for x, _, _ in traces], [y for _, y, _ in traces], dt=DT, smooth=10, cut=[1, 1])
+    diffs = {}
+    for orthogonal in (False, True):
+        windowed = batch.windowed_betas(2.0, 0.5, rlim=[0.5, 80], orthogonal=orthogonal)
+        for i, (x, y, t) in enumerate(traces):
+            reference = Trajectory(x, y, t, dt=DT, smooth=10, cut=[1, 1]).windowed_betas(2.0, 0.5, rlim=[0.5, 80],
+                                                                                        orthogonal=orthogonal)
+            for name in ("t", "n", "betaCA", "r2CA", "betaCV", "offsetCV", "r2CV", "betaRV"):
+                diffs[name] = max(diffs.get(name, 0.0), max_difference(getattr(windowed[i], name), getattr(reference, name)))
+    return diffs
+
+
+@agreement("TrajectoryBatch.cycle_betas vs Trajectory.cycle_betas", 1e-8)
+def _batch_cycles_vs_trajectory():
+    traces = noisy_ellipses()
+    batch = TrajectoryBatch([x for x, _, _ in traces], [y for _, y, _ in traces], dt=DT, smooth=10, cut=[1, 1])
+    diffs = {}
+    for freq in (None, 0.5):
+        edges = batch.cycle_edges(freq=freq)
+        cycles = batch.cycle_betas(freq=freq, rlim=[0.5, 80])
+        for i, (x, y, t) in enumerate(traces):
+            tr = Trajectory(x, y, t, dt=DT, smooth=10, cut=[1, 1])
+            if len(edges[i]) != len(tr.cycle_edges(freq=freq)) or np.any(edges[i] != tr.cycle_edges(freq=freq)):
+                diffs["edges"] = np.inf
+            reference = tr.cycle_betas(freq=freq, rlim=[0.5, 80])
+            for name in ("start", "t", "period", "length", "n", "betaCA", "r2CA", "betaCV", "offsetCV", "r2CV"):
+                diffs[name] = max(diffs.get(name, 0.0), max_difference(getattr(cycles[i], name), getattr(reference, name)))
+    return diffs
+
+
+@agreement("Trajectory.retrack_batch vs retrack", 1e-3)
+def _retrack_batch_vs_retrack():
+    # on noisy pen data both are dominated by their different interpolation errors where the
+    # warp compresses time most, so the comparison is on a smooth trace
+    tr = Trajectory(*ellipse(4000, freq=0.5), dt=DT)
+    betas = [0, -1/3, -2/3]
+    grid, x, y = tr.retrack_batch(target_betaCV=betas)
+    batch = tr.retrack_batch(target_betaCV=betas, kinematics=True).calc_betas()
+    diffs = {}
+    for i, beta in enumerate(betas):
+        retracked = tr.retrack(target_betaCV=beta)
+        fit = retracked.fit()
+        diffs["t"] = max(diffs.get("t", 0.0), max_difference(grid, retracked.t))
+        diffs["x / radius"] = max(diffs.get("x / radius", 0.0), max_difference(x[i] / 10, retracked.x / 10))
+        diffs["y / radius"] = max(diffs.get("y / radius", 0.0), max_difference(y[i] / 5, retracked.y / 5))
+        diffs["betaCV"] = max(diffs.get("betaCV", 0.0), max_difference(batch.betaCV[i], fit.betaCV))
+    return diffs
+
+
+@agreement("chunked.process_chunked vs Trajectory", 1e-10)
+def _chunked_vs_trajectory():
+    x, y, t = make_trace("pen", 60000)
+    diffs = {}
+    for method in util.DERIVATIVE_METHODS:
+        tr = Trajectory(x, y, t, dt=DT, smooth=10, cut=[5, 2], derivative=method)
+        fit = tr.fit(rlim=[0.5, 80])
+        chunked = process_chunked(x, y, t, DT, smooth=10, cut=[5, 2], rlim=[0.5, 80], chunk=7000, derivative=method)
+        for name in ("betaCA", "offsetCA", "r2CA", "betaCV", "offsetCV", "r2CV", "betaRV", "r2RV"):
+            diffs[name] = max(diffs.get(name, 0.0), max_difference(getattr(chunked, name), getattr(fit, name)))
+        diffs["n"] = max(diffs.get("n", 0.0), abs(chunked.n - len(fit.logC)))
+        diffs["length / length"] = max(diffs.get("length / length", 0.0), abs(chunked.length / tr.ds.sum() - 1))
+        diffs["J / J"] = max(diffs.get("J / J", 0.0), abs(chunked.J / tr.J - 1))
+    return diffs
+
+
+@agreement("bootstrap.block_bootstrap vs stats.linregress of each replicate", 1e-10)
+def _block_bootstrap_vs_loop():
+    fit = Trajectory(*pen_trace(), dt=DT, smooth=10, cut=[5, 2]).fit(rlim=[0.5, 80])
+    x, y, n = fit.logC, fit.logV, len(fit.logC)
+    diffs = {}
+    for circular in (False, True):
+        beta, offset, r2 = block_bootstrap(x, y, 400, 20, seed=1, circular=circular)
+        starts, stops = draw_blocks(n, 400, 20, np.random.default_rng(1), circular)
+        for i in range(20):
+            idx = np.concatenate([np.arange(a, b) % n for a, b in zip(starts[i], stops[i])])
+            ref = stats.linregress(x[idx], y[idx])
+            for name, value, expected in (("beta", beta[i], ref.slope), ("offset", offset[i], ref.intercept),
+                                          ("r2", r2[i], ref.rvalue ** 2)):
+                diffs[name] = max(diffs.get(name, 0.0), max_difference(value, expected))
+    return diffs
+
+
+def derivative_accuracy(n=6000, frequencies=np.geomspace(0.033, 1.2, 5), noise=0.01, seed=0, log=print):
+    """Errors of each derivative backend on ellipses at the experiment's target frequencies: relative
+       RMS errors of V, |acceleration|, |jerk| and C against the analytic values, the betaCV error
+       (exactly -1/3 for an ellipse) and the time to compute all kinematics. Clean ellipses are
+       differentiated directly, noisy ones after the usual 10 Hz filter. The first and last
+       second are left out of the errors."""
+    rng = np.random.default_rng(seed)
+    ra, rb = 10.0, 5.0
+    rows = []
+    for condition in ("clean", "noisy"):
+        for freq in frequencies:
+            x, y, t = ellipse(n, ra, rb, freq)
+            w = 2 * np.pi * freq
+            true = {"V": w * np.hypot(ra * np.sin(w * t), rb * np.cos(w * t)),
+                    "|acc|": w**2 * np.hypot(x, y),
+                    "|jerk|": w**3 * np.hypot(ra * np.sin(w * t), rb * np.cos(w * t))}
+            true["C"] = w**3 * ra * rb / true["V"]**3
+            smooth = None
+            if condition == "noisy":
+                x = x + noise * rng.standard_normal(n)
+                y = y + noise * rng.standard_normal(n)
+                smooth = 10
+            inner = slice(int(1 / DT), n - int(1 / DT))
+            for method in util.DERIVATIVE_METHODS:
+                tr = Trajectory(x, y, t, dt=DT, smooth=smooth, derivative=method)
+                start = perf_counter()
+                fit = tr.fit(rlim=[0.5, 80])
+                elapsed = perf_counter() - start
+                estimate = {"V": tr.V, "|acc|": np.hypot(tr.xacc, tr.yacc), "|jerk|": np.hypot(tr.xjerk, tr.yjerk), "C": tr.C}
+                row = {"condition": condition, "freq": float(freq), "method": method, "kinematics_ms": elapsed * 1000,
+                       "betaCV_error": float(fit.betaCV + 1/3)}
+                for name, value in true.items():
+                    error = (estimate[name] - value)[inner]
+                    row[name] = float(np.sqrt(np.nanmean(error**2) / np.mean(value[inner]**2)))
+                rows.append(row)
+                log(f"{condition:6s} {freq:6.3f} Hz {method:7s} " + " ".join(f"{k} {row[k]:9.2e}" for k in true)
+                    + f"  betaCV {row['betaCV_error']:+9.2e}  {row['kinematics_ms']:6.2f} ms")
+    return rows
+
+
+def check_agreement(names=None, log=print):
+    """Run the agreement checks; returns the names of those that failed"""
+    failed = []
+    for name in names or AGREEMENT_CHECKS:
+        check, tolerance = AGREEMENT_CHECKS[name]
+        diffs = check()
+        worst = max(diffs.values(), default=0.0)
+        ok = worst <= tolerance
+        if not ok: failed.append(name)
+        log(f"{'ok  ' if ok else 'FAIL'} {name}: max difference {worst:.3g} (tolerance {tolerance:g})")
+        if not ok:
+            for quantity, diff in diffs.items(): log(f"       {quantity}: {diff:.3g}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=SIZES, help="trace lengths in samples")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), help="cases to run (default: all)")
+    parser.add_argument("--sources", nargs="+", choices=SOURCES, default=list(SOURCES))
+    parser.add_argument("--pen", help="recorded trial to tile for the pen source (default: first P*/recording_trial*.json)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case below 10^6 samples; the fastest is reported")
+    parser.add_argument("--no-limits", action="store_true", help="also run cases above their max_n, e.g. scipy.odr above 10^5 samples, which takes minutes")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare the results against")
+    parser.add_argument("--tolerance", type=float, default=1.3, help="allowed time and memory ratio to the baseline")
+    parser.add_argument("--check", action="store_true", help="only run the agreement checks")
+    parser.add_argument("--derivatives", action="store_true", help="only report the accuracy of the derivative backends")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if check_agreement() else 0)
+    if args.derivatives:
+        rows = derivative_accuracy()
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump({"environment": environment(), "derivatives": rows}, f, indent=1)
+        return
+
+    sizes = [int(n) for n in args.sizes]
+    results = run(args.cases, args.sources, sizes, args.repeat, args.pen, limits=not args.no_limits)
+    report = {"environment": environment(), "results": results}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['source']} n={r['n']}: {r['measure']} {r['baseline']:.4g} -> {r['now']:.4g} ({r['ratio']:.2f}x)")
+        if regressions: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+""" Block bootstrap confidence intervals for the power law exponents of each trial.
+
+Samples 5 ms apart are strongly autocorrelated, so replicates are built from blocks
+of consecutive samples rather than from single samples: a moving-block bootstrap
+draws blocks of a fixed length at random starts, the circular variant lets blocks
+wrap around the end of the trace, and with boundaries (e.g. movement cycle starts)
+whole segments are drawn. All block starts of all replicates are drawn as one array,
+and the regression sums of every replicate are differences of prefix sums of x, y,
+x^2, xy and y^2 at the block ends, so no replicate is ever materialised.
+
+Trials are bootstrapped in a process pool, each with its own child of one
+SeedSequence, so results only depend on the seed and not on the number of workers.
+
+    python bootstrap.py [-o bootstrap.json] [--workers N] [--replicates 2000] [--block 2.0 | --cycles] [--circular] [--seed 0]
+"""
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from util import moments_from_sums, linregress_from_moments, tls_from_moments
+from corpus_analysis import DEFAULT_PARAMS, find_trials
+from trajectory_analysis import Trajectory
+from trials import load_pen, parse_trial_filename
+
+
+def draw_blocks(n, block, replicates, rng, circular=False, boundaries=None):
+    """Start and stop sample indices of the blocks of every replicate, arrays of shape
+       (replicates, blocks). Each replicate has ceil(n / block) blocks, or as many
+       segments as boundaries delimit. Circular stops may run past n and wrap around."""
+    if boundaries is not None:
+        edges = np.asarray(boundaries, dtype=int)
+        pick = rng.integers(0, len(edges) - 1, size=(replicates, len(edges) - 1))
+        return edges[pick], edges[pick + 1]
+    block = min(block, n)
+    count = -(-n // block)
+    starts = rng.integers(0, n if circular else n - block + 1, size=(replicates, count))
+    return starts, starts + block
+
+
+def replicate_sums(columns, starts, stops):
+    """Sum of each row of columns over the blocks of every replicate, shape (rows, replicates)"""
+    n = columns.shape[1]
+    wrap = max(0, int(stops.max()) - n)
+    if wrap: columns = np.concatenate([columns, columns[:, :wrap]], axis=1)
+    prefix = np.zeros((columns.shape[0], columns.shape[1] + 1))
+    np.cumsum(columns, axis=1, out=prefix[:, 1:])
+    return np.stack([p[stops].sum(axis=-1) - p[starts].sum(axis=-1) for p in prefix])
+
+
+def block_bootstrap(x, y, block, replicates=1000, seed=None, circular=False, boundaries=None, orthogonal=False):
+    """beta, offset and r2 of y = beta * x + offset in each bootstrap replicate.
+       block is in samples; seed is anything np.random.default_rng accepts, and the same
+       seed draws the same blocks for any x and y of the same length."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    rng = np.random.default_rng(seed)
+    starts, stops = draw_blocks(len(x), block, replicates, rng, circular, boundaries)
+    # centred to keep the sums well conditioned
+    mx, my = x.mean(), y.mean()
+    dx, dy = x - mx, y - my
+    sums = replicate_sums(np.stack([dx, dy, dx * dx, dx * dy, dy * dy]), starts, stops)
+    n = (stops - starts).sum(axis=-1)
+    regression = tls_from_moments if orthogonal else linregress_from_moments
+    beta, offset, r2 = regression(*moments_from_sums(n, *sums))
+    return beta, offset + my - beta * mx, r2
+
+
+def percentile_interval(values, level=0.95):
+    low, high = np.nanpercentile(values, [50 * (1 - level), 50 * (1 + level)])
+    return float(low), float(high)
+
+
+def bootstrap_trial(filename, seed=None, block=2.0, replicates=2000, level=0.95, circular=False, cycles=False,
+                    params=DEFAULT_PARAMS):
+    """Point estimates and bootstrap intervals of betaCV and betaCA of a trial file; block is in seconds.
+       With cycles, whole movement cycles of the target frequency are resampled instead of blocks."""
+    params = dict(DEFAULT_PARAMS, **params)
+    info = parse_trial_filename(filename)
+    tr = Trajectory(*load_pen(filename), dt=params["dt"], cut=params["cut"], smooth=params["smooth"],
+                    filter_order=params["filter_order"], derivative=params["derivative"])
+    fit = tr.fit(rlim=params["rlim"], orthogonal=params["orthogonal"])
+    seed = np.random.SeedSequence() if seed is None else seed
+    block_samples = max(1, int(round(block / params["dt"])))
+    boundaries = None
+    if cycles:
+        # cycle starts as positions among the samples kept by the fit
+        boundaries = np.searchsorted(np.flatnonzero(fit.mask), tr.cycle_edges(freq=float(info["freq"])))
+        if len(boundaries) < 3: boundaries = None
+    row = {"freq": info["freq"], "beta": info["beta"], "participant": info["participant"], "trial": info["trial"]}
+    for name, y in (("CV", fit.logV), ("CA", fit.logA)):
+        # the same seed for both fits, so CV and CA are resampled with the same blocks
+        betas = block_bootstrap(fit.logC, y, block_samples, replicates, seed, circular, boundaries,
+                                orthogonal=params["orthogonal"])[0]
+        low, high = percentile_interval(betas, level)
+        row["pen_beta" + name] = float(getattr(fit, "beta" + name))
+        row["pen_beta" + name + "_low"] = low
+        row["pen_beta" + name + "_high"] = high
+        row["pen_beta" + name + "_se"] = float(np.nanstd(betas))
+    return row
+
+
+def bootstrap_trials(files, seed=0, workers=None, chunksize=4, **kwargs):
+    """bootstrap_trial of every file, in order; workers=1 runs in this process"""
+    seeds = np.random.SeedSequence(seed).spawn(len(files))
+    run = partial(bootstrap_trial, **kwargs)
+    if workers == 1: return list(map(run, files, seeds))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, files, seeds, chunksize=chunksize))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--experiment-dir", default=".")
+    parser.add_argument("-o", "--output", default="bootstrap.json")
+    parser.add_argument("--workers", type=int, default=None, help="default: number of CPUs")
+    parser.add_argument("--replicates", type=int, default=2000)
+    parser.add_argument("--block", type=float, default=2.0, help="block length in seconds")
+    parser.add_argument("--level", type=float, default=0.95)
+    parser.add_argument("--circular", action="store_true")
+    parser.add_argument("--cycles", action="store_true", help="resample whole cycles of the target frequency")
+    parser.add_argument("--orthogonal", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = bootstrap_trials(find_trials(args.experiment_dir), seed=args.seed, workers=args.workers,
+                            block=args.block, replicates=args.replicates, level=args.level, circular=args.circular,
+                            cycles=args.cycles,
+                            params=dict(DEFAULT_PARAMS, orthogonal=args.orthogonal))
+    with open(args.output, "w") as f:
+        json.dump(rows, f, indent=1)
+    print(f"Saved {len(rows)} trials to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+""" Power law fits of recordings too long to process in memory.
+
+The uniform sample grid of the whole recording (the same grid Trajectory uses) is
+split into chunks. Each chunk is processed as a Trajectory over the chunk plus margin
+samples on both sides, built from just the raw samples around it, so the filtfilt
+transients and spline end effects at the chunk edges die out inside the margins.
+Only the chunk's own samples are kept: their kinematics can be written, stitched
+together, to a .npy file, and their log C, V, A, R sums are added up for the fits.
+Memory therefore depends on the chunk size, not on the recording length; the raw
+arrays can be memory-mapped, e.g. the pen stream of a trial_store .trial.
+
+    python chunked.py trial_store/P1/recording_trial_1_....trial [--chunk 100000] [--margin 1000] [--out kinematics.npy]
+"""
+import argparse
+import os
+from collections import namedtuple
+import numpy as np
+from numpy.lib.format import open_memmap
+from trajectory_analysis import Trajectory, cut_slice, fit_mask
+from util import moments_from_sums, linregress_from_moments, tls_from_moments
+
+FIELDS = ("t", "x", "y", "V", "A", "C", "R")
+
+ChunkedFit = namedtuple("ChunkedFit", ["betaCA", "offsetCA", "r2CA",
+                                       "betaCV", "offsetCV", "r2CV",
+                                       "betaRV", "offsetRV", "r2RV",
+                                       "samples", "n", "length", "J"])
+
+PAIRS = (("CA", "logC", "logA"), ("CV", "logC", "logV"), ("RV", "logR", "logV"))
+
+
+def iter_chunks(x, y, t, dt=0.005, smooth=None, filter_order=2, cut=None, chunk=100000, margin=1000,
+                transform=None, derivative="spline"):
+    """(start, trajectory, core) for consecutive chunks of the grid left after cut; start is the
+       index of the chunk's first sample among the kept ones and trajectory.<name>[core] are the
+       chunk's samples. transform(x, y), if given, is applied to each slice of raw samples."""
+    n = len(t)
+    t0 = float(t[0])
+    keep = cut_slice(n, cut, dt)
+    first, stop = keep.start, max(keep.start, keep.stop)
+    for a in range(first, stop, chunk):
+        b = min(a + chunk, stop)
+        lo, hi = max(0, a - margin), min(n, b + margin)
+        grid = t0 + np.arange(lo, hi) * dt
+        # raw samples covering the grid, with as many again on each side for the spline ends
+        r0 = max(0, int(np.searchsorted(t, grid[0])) - margin)
+        r1 = min(n, int(np.searchsorted(t, grid[-1], side="right")) + margin)
+        rx, ry = np.asarray(x[r0:r1], dtype=float), np.asarray(y[r0:r1], dtype=float)
+        if transform is not None: rx, ry = transform(rx, ry)
+        tr = Trajectory(rx, ry, np.asarray(t[r0:r1], dtype=float), dt, smooth=smooth, filter_order=filter_order,
+                        derivative=derivative, grid=grid)
+        yield a - first, tr, slice(a - lo, b - lo)
+
+
+def process_chunked(x, y, t, dt=0.005, smooth=None, filter_order=2, cut=None, rlim=None, orthogonal=False,
+                    chunk=100000, margin=1000, transform=None, derivative="spline", out=None):
+    """CA, CV and RV fits, path length and jerk cost of a recording, processed chunk by chunk.
+       With out, the kinematics in FIELDS are written to a .npy file of shape (len(FIELDS), samples)."""
+    keep = cut_slice(len(t), cut, dt)
+    samples = max(0, keep.stop - keep.start)
+    stored = open_memmap(out, mode="w+", shape=(len(FIELDS), samples)) if out else None
+    ref = None       # means of the first kept samples, subtracted to keep the sums well conditioned
+    count = 0
+    sums = {}
+    length = jerk = 0.0
+    for start, tr, core in iter_chunks(x, y, t, dt, smooth, filter_order, cut, chunk, margin, transform, derivative):
+        if stored is not None:
+            for i, name in enumerate(FIELDS):
+                stored[i, start:start + core.stop - core.start] = getattr(tr, name)[core]
+        length += float(np.sum(tr.ds[core]))
+        jerk += float(np.sum(np.sqrt(tr.xjerk[core]**2 + tr.yjerk[core]**2))) * dt
+        logs = {name: value[core] for name, value in tr.logs.items()}
+        mask = fit_mask(logs, rlim)
+        if not mask.any(): continue
+        kept = {name: logs[name][mask] for name in ("logC", "logV", "logA", "logR")}
+        if ref is None: ref = {name: float(value.mean()) for name, value in kept.items()}
+        kept = {name: value - ref[name] for name, value in kept.items()}
+        count += len(kept["logC"])
+        for name, value in kept.items():
+            sums[name] = sums.get(name, 0.0) + float(np.sum(value))
+            sums[name + "2"] = sums.get(name + "2", 0.0) + float(np.sum(value * value))
+        for pair, xname, yname in PAIRS:
+            sums[pair] = sums.get(pair, 0.0) + float(np.sum(kept[xname] * kept[yname]))
+    if stored is not None: stored.flush()
+
+    fits = []
+    regression = tls_from_moments if orthogonal else linregress_from_moments
+    for pair, xname, yname in PAIRS:
+        if count < 2:
+            fits += [np.nan, np.nan, np.nan]
+            continue
+        moments = moments_from_sums(count, sums[xname], sums[yname], sums[xname + "2"], sums[pair], sums[yname + "2"])
+        beta, offset, r2 = regression(*moments)
+        fits += [float(beta), float(offset + ref[yname] - beta * ref[xname]), float(r2)]
+    return ChunkedFit(*fits, samples, count, length, jerk)
+
+
+def main():
+    from trial_store import load_trial
+    from trials import x_to_cm, y_to_cm
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="a trial_store .trial directory (pen stream, converted to cm) or a .npy of x, y, t rows")
+    parser.add_argument("--dt", type=float, default=0.005)
+    parser.add_argument("--smooth", type=float, default=10)
+    parser.add_argument("--cut", type=float, nargs=2, default=[5, 2])
+    parser.add_argument("--rlim", type=float, nargs=2, default=[0.5, 80])
+    parser.add_argument("--orthogonal", action="store_true")
+    parser.add_argument("--chunk", type=int, default=100000, help="samples per chunk")
+    parser.add_argument("--margin", type=int, default=1000, help="samples processed on each side of a chunk and discarded")
+    parser.add_argument("--out", help="write the stitched kinematics to this .npy file")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        x, y, t = load_trial(args.path).pen
+        transform = lambda rx, ry: (x_to_cm(rx), y_to_cm(ry))
+    else:
+        x, y, t = np.load(args.path, mmap_mode="r")
+        transform = None
+    fit = process_chunked(x, y, t, args.dt, args.smooth, cut=args.cut, rlim=args.rlim, orthogonal=args.orthogonal,
+                          chunk=args.chunk, margin=args.margin, transform=transform, out=args.out)
+    for name, value in fit._asdict().items():
+        print(f"{name:9s} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+""" Power law fits of all recording trials, written to results.json.
+
+Trials are found with the P<n>/ layout of run_experiment.create_next_p_directory and
+analysed in a process pool. Rows are written to disk as they complete, in the same
+order on every run (sorted by freq, then participant and trial number). A trial that
+fails to load or fit is reported and skipped without stopping the run. With --cache,
+results of unchanged trials are read from a ResultCache instead of recomputed.
+
+    python corpus_analysis.py [-o results.json] [--workers N] [--chunksize 4] [--cache DIR] [--derivative savgol]
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from result_cache import ResultCache
+from trajectory_analysis import Trajectory
+from trials import load_pen, parse_trial_filename
+from util import DERIVATIVE_METHODS
+
+DEFAULT_PARAMS = {"dt": 0.005, "smooth": 10, "cut": [5, 2], "filter_order": 2, "rlim": [0.5, 80], "orthogonal": False,
+                  "derivative": "spline"}
+
+
+def trial_sort_key(filename):
+    info = parse_trial_filename(filename)
+    participant = int(re.search(r'\d+', info["participant"]).group())
+    return info["freq"], participant, info["trial"]
+
+
+def find_trials(experiment_dir="."):
+    """Recording trial files of all P<n> folders, in output order"""
+    files = glob.glob(os.path.join(experiment_dir, "P[0-9]*", "recording_trial*.json"))
+    return sorted(files, key=trial_sort_key)
+
+
+def analyse_trial(filename, dt=0.005, smooth=10, cut=[5, 2], filter_order=2, rlim=[0.5, 80], orthogonal=False, derivative="spline",
+                  with_arrays=False):
+    """One results.json row for a trial file, and the kinematic arrays if with_arrays is set"""
+    info = parse_trial_filename(filename)
+    tr = Trajectory(*load_pen(filename), dt=dt, cut=cut, smooth=smooth, filter_order=filter_order, derivative=derivative)
+    fit = tr.fit(rlim=rlim, orthogonal=orthogonal)
+    row = {"freq"      : info["freq"],
+           "beta"      : info["beta"],
+           "pen_betaCV": float(fit.betaCV),
+           "pen_r2CV"  : float(fit.r2CV),
+           "pen_betaCA": float(fit.betaCA),
+           "pen_r2CA"  : float(fit.r2CA),
+           "participant": info["participant"],
+           "trial"     : info["trial"]}
+    if not with_arrays: return row
+    return row, {"t": tr.t, "x": tr.x, "y": tr.y, "V": tr.V, "C": tr.C, "A": tr.A, "R": tr.R, "mask": fit.mask}
+
+
+def analyse_cached(filename, params, cache=None, with_arrays=False):
+    """analyse_trial through a ResultCache, skipping the analysis on a hit"""
+    if cache is None: return analyse_trial(filename, **params)
+    key = cache.key(filename, params)
+    row = cache.get(key)
+    if row is not None and (not with_arrays or cache.has_arrays(key)): return row
+    if with_arrays:
+        row, arrays = analyse_trial(filename, with_arrays=True, **params)
+    else:
+        row, arrays = analyse_trial(filename, **params), None
+    cache.put(key, row, arrays, evict=False)  # evicted once by the main process after the run
+    return row
+
+
+def analyse_safely(filename, params, cache=None, with_arrays=False):
+    try:
+        return True, analyse_cached(filename, params, cache, with_arrays)
+    except Exception as e:
+        return False, {"file": filename, "error": repr(e), "traceback": traceback.format_exc()}
+
+
+def run(files, output="results.json", workers=None, chunksize=4, params=DEFAULT_PARAMS, cache=None, with_arrays=False):
+    """Analyse files in a process pool and stream the rows to output; returns the failed trials.
+       With a ResultCache only trials whose file, parameters or analysis code changed are recomputed."""
+    errors = []
+    tmp = output + ".tmp"
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(tmp, "w") as f:
+        f.write("[")
+        written = 0
+        analyse = partial(analyse_safely, params=params, cache=cache, with_arrays=with_arrays)
+        for ok, row in pool.map(analyse, files, chunksize=chunksize):
+            if not ok:
+                errors.append(row)
+                print(f"Error analysing {row['file']}: {row['error']}", file=sys.stderr)
+                continue
+            f.write((", " if written else "") + json.dumps(row))
+            f.flush()
+            written += 1
+        f.write("]")
+    os.replace(tmp, output)
+    if cache is not None: cache.evict()
+    print(f"Saved {written} of {len(files)} trials to {output}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--experiment-dir", default=".")
+    parser.add_argument("-o", "--output", default="results.json")
+    parser.add_argument("--workers", type=int, default=None, help="default: number of CPUs")
+    parser.add_argument("--chunksize", type=int, default=4)
+    parser.add_argument("--orthogonal", action="store_true")
+    parser.add_argument("--derivative", choices=DERIVATIVE_METHODS, default="spline", help="kinematics backend")
+    parser.add_argument("--cache", help="directory of a result cache to reuse unchanged trials")
+    parser.add_argument("--cache-size", type=float, default=1024, help="cache size limit in MB")
+    parser.add_argument("--cache-arrays", action="store_true", help="also cache the kinematic arrays")
+    args = parser.parse_args()
+
+    params = dict(DEFAULT_PARAMS, orthogonal=args.orthogonal, derivative=args.derivative)
+    cache = ResultCache(args.cache, max_bytes=int(args.cache_size * 2**20)) if args.cache else None
+    errors = run(find_trials(args.experiment_dir), args.output, args.workers, args.chunksize, params,
+                 cache=cache, with_arrays=args.cache_arrays)
+    if errors:
+        with open(args.output + ".errors.json", "w") as f:
+            json.dump(errors, f, indent=1)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+""" All trials of all participants in one indexed, memory-mapped store.
+
+The pen, cursor and target streams of every trial are concatenated into one float64
+array per stream, <store>/<stream>.npy of shape (3, total samples) with x, y and t
+rows. <store>/trials.npy is the index: a structured array with one row per trial
+holding its metadata (participant, phase, trial number, freq, beta, design indices
+and session order from experiment_summary.json) and the start and sample count of
+each of its streams. Opening the store maps the stream files and reads only the
+index, so selecting trials is a few array comparisons and their samples are views
+into the mapped files; no JSON is read after the store is built.
+
+    python corpus_store.py [experiment_dir] [out_dir]     # build corpus_store/
+
+    store = CorpusStore("corpus_store")
+    for trial in store.trials(freq=1.2, beta=-0.667): x, y, t = trial.pen_cm()
+"""
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+from numpy.lib.format import open_memmap
+from trial_store import STREAMS, load_summary, trial_metadata
+from trials import x_to_cm, y_to_cm
+
+INDEX_DTYPE = [("participant", "U16"), ("phase", "U16"), ("trial", "i4"), ("order", "i4"),
+               ("freq", "f8"), ("beta", "f8"), ("freq_label", "U16"), ("beta_label", "U16"),
+               ("freq_index", "i4"), ("beta_index", "i4"), ("completion_time", "U32")] + \
+              [(stream + suffix, "i8") for stream in STREAMS for suffix in ("_start", "_count")]
+
+
+def index_row(meta, summary, starts, counts):
+    """One index entry; design indices, order and completion time are -1 or empty without a summary"""
+    order = freq_index = beta_index = -1
+    freq, beta = float(meta["freq"]), float(meta["beta"])
+    if summary is not None:
+        order = meta["trial"] - 1
+        if meta["phase"] == "recording": order += len(summary["training_trials"])
+        freq_index, beta_index = meta["freq_index"], meta["beta_index"]
+        freq, beta = meta["freq_value"], meta["beta_value"]
+    fields = (meta["participant"], meta["phase"], meta["trial"], order, freq, beta, meta["freq"], meta["beta"],
+              freq_index, beta_index, (summary or {}).get("completion_time") or "")
+    return fields + tuple(v for stream in STREAMS for v in (starts[stream], counts[stream]))
+
+
+def build(experiment_dir=".", out_dir="corpus_store"):
+    """Pack every P*/ trial file under experiment_dir into a store at out_dir, one trial in memory at a time"""
+    os.makedirs(out_dir, exist_ok=True)
+    rows = []
+    totals = dict.fromkeys(STREAMS, 0)
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp:
+        # each row of each stream is appended to its own raw file, then copied into place
+        raw = {(stream, i): open(os.path.join(tmp, f"{stream}{i}"), "wb") for stream in STREAMS for i in range(3)}
+        for participant_dir in sorted(glob.glob(os.path.join(experiment_dir, "P[0-9]*"))):
+            summary = load_summary(participant_dir)
+            for filename in sorted(glob.glob(os.path.join(participant_dir, "*_trial_*.json"))):
+                with open(filename) as f:
+                    d = json.load(f)
+                counts = {}
+                for stream in STREAMS:
+                    columns = np.array([d[stream]["xs"], d[stream]["ys"], d[stream]["ts"]], dtype=float).reshape(3, -1)
+                    for i in range(3): raw[stream, i].write(columns[i].tobytes())
+                    counts[stream] = columns.shape[1]
+                rows.append(index_row(trial_metadata(filename, summary), summary, dict(totals), counts))
+                for stream in STREAMS: totals[stream] += counts[stream]
+        for f in raw.values(): f.close()
+
+        for stream in STREAMS:
+            out = open_memmap(os.path.join(out_dir, stream + ".npy"), mode="w+", shape=(3, totals[stream]))
+            offset = out.offset
+            del out
+            with open(os.path.join(out_dir, stream + ".npy"), "r+b") as f:
+                f.seek(offset)
+                for i in range(3):
+                    with open(os.path.join(tmp, f"{stream}{i}"), "rb") as part:
+                        shutil.copyfileobj(part, f)
+    index = np.array(rows, dtype=INDEX_DTYPE)
+    np.save(os.path.join(out_dir, "trials.npy"), index)
+    return CorpusStore(out_dir)
+
+
+class CorpusTrial:
+    """One trial of a CorpusStore, with the streams of trial_store.StoredTrial; pen, cursor
+       and target are (3, n) views into the store's mapped stream files. Pen pressures and
+       frame timings are not packed into the corpus; they are in the trial_store copies."""
+    def __init__(self, store, row):
+        self.meta = {name: store.index[name][row].item() for name in store.index.dtype.names}
+        for stream in STREAMS:
+            start, count = self.meta[stream + "_start"], self.meta[stream + "_count"]
+            setattr(self, stream, store.streams[stream][:, start:start + count])
+
+    def pen_cm(self):
+        """Pen x and y converted to cm and t, as returned by trials.load_pen"""
+        xs, ys, ts = self.pen
+        return x_to_cm(xs), y_to_cm(ys), ts
+
+
+class CorpusStore:
+    def __init__(self, path="corpus_store", mmap_mode="r"):
+        self.path = path
+        self.index = np.load(os.path.join(path, "trials.npy"))
+        self.streams = {stream: np.load(os.path.join(path, stream + ".npy"), mmap_mode=mmap_mode) for stream in STREAMS}
+
+    def __len__(self):
+        return len(self.index)
+
+    def select(self, **criteria):
+        """Index rows matching all criteria, e.g. select(freq=1.2, beta=-0.667, participant="P3").
+           A value may be a list of accepted values; freq and beta match to the three decimals of
+           the trial file names and also accept those strings."""
+        keep = np.ones(len(self.index), dtype=bool)
+        for field, value in criteria.items():
+            values = value if isinstance(value, (list, tuple, set, np.ndarray)) else [value]
+            column = self.index[field]
+            if field in ("freq", "beta"):
+                values = np.asarray([float(v) for v in values])
+                keep &= np.any(np.abs(column[:, None] - values[None, :]) < 5e-4, axis=1)
+            else:
+                keep &= np.isin(column, list(values))
+        return np.flatnonzero(keep)
+
+    def trial(self, row):
+        return CorpusTrial(self, row)
+
+    def trials(self, **criteria):
+        """CorpusTrial of every row matching criteria, in store order"""
+        return [self.trial(row) for row in self.select(**criteria)]
+
+    def table(self):
+        """The index as a pandas DataFrame"""
+        import pandas as pd
+        return pd.DataFrame(self.index)
+
+
+if __name__ == "__main__":
+    experiment_dir = sys.argv[1] if len(sys.argv) > 1 else "."
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else "corpus_store"
+    store = build(experiment_dir, out_dir)
+    print(f"Stored {len(store)} trials, {store.streams['pen'].shape[1]} pen samples, in {out_dir}")
@@ -0,0 +1,106 @@
+""" Frame pacing and timing records for the experiment's render loop.
+
+    SDL_VIDEODRIVER=dummy python frame_scheduler.py [frames]    # headless benchmark
+"""
+import os
+import sys
+import time
+from time import perf_counter
+import numpy as np
+
+
+class FrameScheduler:
+    """Paces a render loop at a fixed rate and records how long each frame took.
+
+    wait() sleeps until spin seconds before the frame deadline and busy-waits only for
+    the rest, which keeps the timing precise without occupying a core between frames.
+    A frame that ends after its deadline is counted as missed and the schedule restarts
+    from the current time instead of trying to catch up."""
+    def __init__(self, fps=60.0, spin=0.002, clock=perf_counter):
+        self.period = 1.0 / fps
+        self.spin = spin
+        self.clock = clock
+        self.deadline = None
+        self.frame_start = None
+        self.render_end = None
+        self.reset()
+
+    def reset(self):
+        """Start new timing records; a frame in progress becomes the first one recorded"""
+        self.frame_starts = [] if self.frame_start is None else [self.frame_start]
+        self.render_times = []
+        self.flip_times = []
+        self.missed = 0
+
+    def begin_frame(self):
+        now = self.clock()
+        if self.deadline is None: self.deadline = now + self.period
+        self.frame_start = now
+        self.frame_starts.append(now)
+        self.render_end = None
+
+    def rendered(self):
+        """Call when drawing is done, right before the display flip"""
+        self.render_end = self.clock()
+        self.render_times.append(self.render_end - self.frame_start)
+
+    def flipped(self):
+        """Call right after the display flip"""
+        self.flip_times.append(self.clock() - self.render_end)
+
+    def wait(self):
+        """Sleep, then spin, until the deadline of the current frame"""
+        now = self.clock()
+        if now > self.deadline:
+            self.missed += 1
+            self.deadline = now + self.period
+            return
+        remaining = self.deadline - now
+        if remaining > self.spin: time.sleep(remaining - self.spin)
+        while self.clock() < self.deadline: pass
+        self.deadline += self.period
+
+    def timings(self):
+        """Per-frame records for a trial file; copies, as recording goes on until the next reset()"""
+        return {"frame_starts": list(self.frame_starts),
+                "render_times": list(self.render_times),
+                "flip_times": list(self.flip_times),
+                "missed": self.missed,
+                "period": self.period}
+
+    def summary(self):
+        """Frame interval, render and flip time statistics in ms"""
+        intervals = np.diff(self.frame_starts) * 1000
+        stats = {"frames": len(self.frame_starts), "missed": self.missed}
+        for name, values in (("interval", intervals), ("render", np.asarray(self.render_times) * 1000),
+                             ("flip", np.asarray(self.flip_times) * 1000)):
+            if len(values) == 0: continue
+            stats[name] = {"mean": float(np.mean(values)), "std": float(np.std(values)),
+                           "p50": float(np.percentile(values, 50)), "p99": float(np.percentile(values, 99)),
+                           "max": float(np.max(values))}
+        return stats
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    pygame.init()
+    screen = pygame.display.set_mode((1600, 1000))
+    scheduler = FrameScheduler()
+    cpu_start = time.process_time()
+    wall_start = perf_counter()
+    for i in range(frames):
+        scheduler.begin_frame()
+        pygame.event.pump()
+        screen.fill((0, 0, 0))
+        pygame.draw.ellipse(screen, (255, 255, 255), (300, 250, 1000, 500), 2)
+        pygame.draw.circle(screen, (255, 0, 0), (800 + int(500 * np.cos(i / 60)), 500 + int(250 * np.sin(i / 60))), 20)
+        scheduler.rendered()
+        pygame.display.flip()
+        scheduler.flipped()
+        scheduler.wait()
+    wall = perf_counter() - wall_start
+    pygame.quit()
+    print(scheduler.summary())
+    print(f"CPU use {100 * (time.process_time() - cpu_start) / wall:.0f}% of one core")
@@ -0,0 +1,75 @@
+""" Replay of recorded pen data as an input device, for running sessions without a tablet. """
+import json
+from time import perf_counter
+import numpy as np
+from sample_buffer import SampleBuffer
+
+
+class ScaledClock:
+    """Seconds since creation, running speed times faster than perf_counter"""
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.origin = perf_counter()
+
+    def __call__(self):
+        return (perf_counter() - self.origin) * self.speed
+
+
+class ReplayInput:
+    """Input device that plays back the pen samples of a trial file in tablet coordinates.
+
+    update() releases every recorded sample whose time the clock has passed, the way
+    Tablet.sample_handler would have received them. The recording is looped, so it
+    can feed trials of any length."""
+    def __init__(self, filename, clock=perf_counter):
+        with open(filename) as f:
+            pen = json.load(f)["pen"]
+        ts = np.asarray(pen["ts"], dtype=float)
+        pressures = pen.get("pressures") or np.ones(len(ts))
+        self.recorded = np.array([ts - ts[0], pen["xs"], pen["ys"], pressures], dtype=float)
+        self.duration = self.recorded[0, -1] + np.median(np.diff(ts))
+        self.clock = clock
+        self.on_sample = None  # optional callback(x, y, t)
+        self.samples = SampleBuffer()
+        self.replayed = 0      # samples released over all trials
+        self.reset_data()
+
+    def reset_data(self):
+        self.start_time = self.clock()
+        self.samples = self.samples.renewed()
+        self.next = 0
+        self.x = 0
+        self.y = 0
+        self.pressure = 0
+
+    # views of the recorded samples, as Tablet has them
+    @property
+    def xs(self): return self.samples.column("x")
+
+    @property
+    def ys(self): return self.samples.column("y")
+
+    @property
+    def times(self): return self.samples.column("t")
+
+    @property
+    def pressures(self): return self.samples.column("pressure")
+
+    def update(self):
+        """Release the samples recorded up to the current clock time"""
+        elapsed = self.clock() - self.start_time
+        ts, xs, ys, pressures = self.recorded
+        n = len(ts)
+        while True:
+            i = self.next % n
+            t = ts[i] + (self.next // n) * self.duration
+            if t > elapsed: break
+            self.x, self.y, self.pressure = xs[i], ys[i], pressures[i]
+            self.samples.append(t, self.x, self.y, self.pressure)
+            if self.on_sample: self.on_sample(self.x, self.y, t)
+            self.next += 1
+            self.replayed += 1
+
+    def close(self):
+        """Placeholder for compatibility with Tablet class"""
+        pass
@@ -0,0 +1,115 @@
+""" Content-addressed cache of trial analyses.
+
+An entry is keyed by the SHA-256 of the raw trial file, the analysis parameters and
+the source of the code that produces it: trajectory_analysis.py, util.py, trials.py
+(unit conversion) and corpus_analysis.py (row layout). Editing that code or changing
+a parameter never returns a stale result. Each entry is a JSON file with the fit results
+and optionally an .npz file with kinematic arrays. When the cache grows beyond
+max_bytes the least recently used entries are removed.
+"""
+import glob
+import hashlib
+import json
+import os
+from functools import lru_cache
+import numpy as np
+
+CODE_FILES = ("trajectory_analysis.py", "util.py", "trials.py", "corpus_analysis.py")
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """Hash of the analysis code the cached results depend on"""
+    h = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_FILES:
+        with open(os.path.join(here, name), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def file_digest(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Analysis results on local disk with size-bounded LRU eviction"""
+    def __init__(self, directory=".analysis_cache", max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filename, params):
+        h = hashlib.sha256()
+        h.update(file_digest(filename).encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        h.update(code_version().encode())
+        return h.hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def get(self, key):
+        """Cached result for key or None; a hit marks the entry as recently used"""
+        path = self.path(key, ".json")
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return result
+
+    def has_arrays(self, key):
+        return os.path.exists(self.path(key, ".npz"))
+
+    def get_arrays(self, key):
+        path = self.path(key, ".npz")
+        if not os.path.exists(path): return None
+        with np.load(path) as arrays:
+            return dict(arrays)
+
+    def put(self, key, result, arrays=None, evict=True):
+        """Store result (JSON-serializable) and optionally a dict of arrays under key"""
+        if arrays is not None:
+            tmp = self.path(key, ".tmp.npz")
+            np.savez(tmp, **arrays)
+            os.replace(tmp, self.path(key, ".npz"))
+        tmp = self.path(key, ".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp, self.path(key, ".json"))
+        if evict: self.evict()
+
+    def entries(self):
+        """(last use, total bytes, paths) for every entry, oldest first"""
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            paths = [path] + glob.glob(path[:-len(".json")] + ".npz")
+            try:
+                size = sum(os.path.getsize(p) for p in paths)
+                entries.append((os.path.getmtime(path), size, paths))
+            except FileNotFoundError:
+                pass
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, paths in entries:
+            if total <= self.max_bytes: break
+            for p in paths:
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+            total -= size
+        return total
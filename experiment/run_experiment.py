@@ -4,9 +4,13 @@ from tablet_reading import Tablet
 import numpy as np
 import ctypes
 import json
-from tracking_data import TrackingData
-from trajectory_analysis import Trajectory
-ctypes.windll.user32.SetProcessDPIAware()  # important for correct resolution of the screen
+from tracking_data import TrackingData, TrialWriter
+from sample_buffer import SampleBuffer
+from target_cache import load_design_grid
+from online_power_law import OnlinePowerLaw
+from frame_scheduler import FrameScheduler
+from replay_input import ReplayInput
+from trials import x_to_cm, y_to_cm
 
 
 def create_next_p_directory():
@@ -17,56 +21,53 @@ def create_next_p_directory():
     print(f"Created directory {next_dir}")    
     return next_dir
 
-folder_path = create_next_p_directory()
-
 
 class MouseFallback:
     """Fallback class to use mouse if tablet is not found"""
     def __init__(self):
+        self.samples = SampleBuffer()
         self.reset_data()
         self.start_time = perf_counter()
+        self.on_sample = None  # optional callback(x, y, t)
         print("Using mouse as fallback input device.")
 
     def reset_data(self):
         self.start_time = perf_counter()
-        self.xs = []
-        self.ys = []
+        self.samples = self.samples.renewed()
         self.x = 0
         self.y = 0
-        self.pressures = []
-        self.times = []
         self.pressure = 0
 
+    # views of the recorded samples, as Tablet has them
+    @property
+    def xs(self): return self.samples.column("x")
+
+    @property
+    def ys(self): return self.samples.column("y")
+
+    @property
+    def times(self): return self.samples.column("t")
+
+    @property
+    def pressures(self): return self.samples.column("pressure")
+
     def update(self):
         """Update mouse position"""
         x, y = pygame.mouse.get_pos()
         t = perf_counter() - self.start_time
-        
+
         self.x = x
         self.y = y
-        self.xs.append(x)
-        self.ys.append(y)
-        self.pressures.append(1 if pygame.mouse.get_pressed()[0] else 0)  # Left mouse button as pressure
-        self.times.append(t)
+        self.pressure = 1 if pygame.mouse.get_pressed()[0] else 0  # Left mouse button as pressure
+        self.samples.append(t, x, y, self.pressure)
+        if self.on_sample: self.on_sample(x, y, t)
 
     def close(self):
         """Placeholder for compatibility with Tablet class"""
         pass
 
-# Initialize pygame
-pygame.init()
-pygame.mouse.set_visible(False)
-WIDTH, HEIGHT = 3200, 2000
-screen = pygame.display.set_mode((WIDTH, HEIGHT), vsync=True, flags=pygame.FULLSCREEN | pygame.DOUBLEBUF)
-
-# Try to initialize tablet, fall back to mouse if not available
-try:
-    input_device = Tablet()
-    if input_device.device is None:
-        raise Exception("No tablet device found")
-except Exception as e:
-    print(f"Tablet initialization failed: {e}")
-    input_device = MouseFallback()
+# Input devices reporting tablet coordinates rather than screen pixels
+TABLET_DEVICES = (Tablet, ReplayInput)
 
 # Colors
 WHITE = (255, 255, 255)
@@ -80,14 +81,6 @@ YELLOW = (255, 255, 0)
 ellipse_width = 1000
 ellipse_height = 500
 circle_radius = 20
-center_x = WIDTH // 2
-center_y = HEIGHT // 2
-
-# Initialize tracking data
-data = TrackingData()
-clock = pygame.time.Clock()
-last_time = perf_counter()
-start_time = input_device.start_time
 
 # Experiment parameters
 modes = ["train", "pause", "recording"]
@@ -95,68 +88,14 @@ frequencies = np.geomspace(0.033, 1.2, 5)
 betas = [0, -1/3, -2/3]
 
 # Training parameters - fixed order as specified
-training = [ 
-    {"freq_index": 0, "beta_index": 0},  
-    {"freq_index": 3, "beta_index": 1}, 
-    {"freq_index": 4, "beta_index": 2},              
+training = [
+    {"freq_index": 0, "beta_index": 0},
+    {"freq_index": 3, "beta_index": 1},
+    {"freq_index": 4, "beta_index": 2},
 ]
 
-# Generate all possible combinations for recording trials
-recording_trials = []
-for freq_idx in range(len(frequencies)):
-    for beta_idx in range(len(betas)):
-        recording_trials.append({"freq_index": freq_idx, "beta_index": beta_idx})
-
-# Shuffle the recording trials to randomize order
-random.shuffle(recording_trials)
-
-# Experiment state management
-experiment_phase = "training"  # "training" or "recording"
-mode = "pause"
-trial_index = 0
-trial_start_time = None
-current_trial_params = None
-target_t = None
 TRIAL_DURATION = 30.0  # Duration in seconds for each trial
 
-def generate_target_trajectory(ra, rb, freq, beta, duration):
-    dt = 0.001
-    ts = np.arange(int(duration/dt)) * dt
-    xs = ra * np.cos(ts * freq * np.pi * 2)
-    ys = rb * np.sin(ts * freq * np.pi * 2)
-    tr = Trajectory(xs, ys, ts, dt=dt)
-    return tr.retrack(target_betaCV=beta)
-
-def setup_next_trial():
-    global experiment_phase, trial_index, current_trial_params, target_t
-    
-    if experiment_phase == "training":
-        if trial_index < len(training):
-            current_trial_params = training[trial_index]
-            print(f"Training trial {trial_index+1}/{len(training)}")
-        else:
-            # Move to recording phase after all training trials
-            experiment_phase = "recording"
-            trial_index = 0
-            print("Training complete. Moving to recording phase.")
-            return setup_next_trial()
-    
-    elif experiment_phase == "recording":
-        if trial_index < len(recording_trials):
-            current_trial_params = recording_trials[trial_index]
-            print(f"Recording trial {trial_index+1}/{len(recording_trials)}")
-        else:
-            # Experiment complete
-            print("Experiment complete!")
-            return False
-    
-    # Setup target trajectory based on current parameters
-    freq = frequencies[current_trial_params["freq_index"]]
-    beta = betas[current_trial_params["beta_index"]]
-    
-    print(f"Setting up trial with frequency={freq:.2f}, beta={beta}")
-    target_t = generate_target_trajectory(ellipse_width, ellipse_height, freq, beta, 35)
-    return True
 
 def draw_centered_text(screen, text, font, color, y_offset=0):
     text_surface = font.render(text, True, color)
@@ -168,109 +107,178 @@ def draw_centered_text(screen, text, font, color, y_offset=0):
     text_rect.center = (center_x, center_y + y_offset)
     screen.blit(text_surface, text_rect)
 
-# Initialize fonts
-font = pygame.font.SysFont("Arial", 50)
-small_font = pygame.font.SysFont("Arial", 30)
-
-# Initialize the first trial
-setup_next_trial()
-
-running = True
-trial_data = {}  # Store data for each trial
-
-# Check if the folder exists, and create it if it doesn't
-if not os.path.exists(folder_path):
-    os.makedirs(folder_path)
-    print(f"Folder '{folder_path}' created successfully")
-else:
-    print(f"Folder '{folder_path}' already exists")
-
-
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_ESCAPE:
-                running = False
-            elif event.key == pygame.K_SPACE:
-                if mode == "pause":
-                    mode = "recording"
-                    trial_start_time = perf_counter()                    
-                    last_time = trial_start_time
-                    input_device.reset_data()
-                    data = TrackingData()
-
-    screen.fill(BLACK)
-
-    # Update mouse position if using mouse fallback
-    if isinstance(input_device, MouseFallback):
-        input_device.update()
-
-    if mode == "pause":
+
+class ExperimentSession:
+    """One session of training and recording trials on an open pygame screen.
+
+    clock gives the session time in seconds; a replay_input.ScaledClock runs the trials
+    accelerated, with frames paced at fps times its speed. With auto_start every trial
+    starts without waiting for SPACE, for unattended (replay) sessions."""
+    def __init__(self, screen, input_device, folder_path, recording_trials=None, trial_duration=TRIAL_DURATION,
+                 clock=perf_counter, fps=60, auto_start=False):
+        self.screen = screen
+        self.input_device = input_device
+        self.folder_path = folder_path
+        self.trial_duration = trial_duration
+        self.clock = clock
+        self.auto_start = auto_start
+        self.WIDTH, self.HEIGHT = screen.get_size()
+        self.center_x = self.WIDTH // 2
+        self.center_y = self.HEIGHT // 2
+
+        # Generate all possible combinations for recording trials, in random order
+        if recording_trials is None:
+            recording_trials = [{"freq_index": freq_idx, "beta_index": beta_idx}
+                                for freq_idx in range(len(frequencies)) for beta_idx in range(len(betas))]
+            random.shuffle(recording_trials)
+        self.recording_trials = recording_trials
+
+        # Live power law estimate of the pen trace for quality control during a trial. Each trial
+        # gets a fresh estimator, fed only while recording; its fit is frozen in last_fit at the end.
+        if isinstance(input_device, TABLET_DEVICES):
+            self.online_settings = {"dt": 0.005, "cutoff": 10, "rlim": (0.5, 80)}
+        else:  # mouse positions in pixels at the frame rate
+            self.online_settings = {"dt": 1.0/60.0, "cutoff": 10, "rlim": None}
+        self.online = OnlinePowerLaw(**self.online_settings)
+        self.last_fit = None  # (betaCV, r2CV, betaCA, r2CA) of the last completed trial
+        input_device.on_sample = self.on_sample
+
+        # Initialize tracking data; trials are saved on a background thread
+        self.data = TrackingData()
+        self.writer = TrialWriter()
+        self.save_errors = []
+        self.scheduler = FrameScheduler(fps=fps * getattr(clock, "speed", 1.0))  # sleep-then-spin pacing, per-frame timings go into each trial file
+        self.trial_timings = []  # FrameScheduler.timings() of every completed trial
+
+        # Experiment state management
+        self.experiment_phase = "training"  # "training" or "recording"
+        self.mode = "pause"  # set last on trial start, first on trial end, as on_sample reads it
+        self.trial_index = 0
+        self.trial_start_time = None
+        self.current_trial_params = None
+        self.target_t = None
+
+        # Lookup tables of all targets, loaded from (or built into) the target cache
+        self.targets = load_design_grid(ellipse_width, ellipse_height, frequencies, betas, 35)
+
+        # Initialize fonts
+        self.font = pygame.font.SysFont("Arial", 50)
+        self.small_font = pygame.font.SysFont("Arial", 30)
+
+        # Check if the folder exists, and create it if it doesn't
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+            print(f"Folder '{folder_path}' created successfully")
+        else:
+            print(f"Folder '{folder_path}' already exists")
+
+    def setup_next_trial(self):
+        if self.experiment_phase == "training":
+            if self.trial_index < len(training):
+                self.current_trial_params = training[self.trial_index]
+                print(f"Training trial {self.trial_index+1}/{len(training)}")
+            else:
+                # Move to recording phase after all training trials
+                self.experiment_phase = "recording"
+                self.trial_index = 0
+                print("Training complete. Moving to recording phase.")
+                return self.setup_next_trial()
+
+        elif self.experiment_phase == "recording":
+            if self.trial_index < len(self.recording_trials):
+                self.current_trial_params = self.recording_trials[self.trial_index]
+                print(f"Recording trial {self.trial_index+1}/{len(self.recording_trials)}")
+            else:
+                # Experiment complete
+                print("Experiment complete!")
+                return False
+
+        # Setup target trajectory based on current parameters
+        freq = frequencies[self.current_trial_params["freq_index"]]
+        beta = betas[self.current_trial_params["beta_index"]]
+
+        print(f"Setting up trial with frequency={freq:.2f}, beta={beta}")
+        self.target_t = self.targets[(self.current_trial_params["freq_index"], self.current_trial_params["beta_index"])]
+        return True
+
+    def on_sample(self, x, y, t):
+        """Input device callback, on the HID thread for the tablet: feeds the trial's estimator while recording"""
+        if self.mode != "recording": return
+        if isinstance(self.input_device, TABLET_DEVICES):
+            self.online.add(x_to_cm(x), y_to_cm(y), t)
+        else:
+            self.online.add(x, y, t)
+
+    def start_trial(self):
+        self.trial_start_time = self.clock()
+        self.scheduler.reset()
+        self.input_device.reset_data()
+        # a new estimator rather than a reset, so a callback still inside add() keeps a consistent one
+        self.online = OnlinePowerLaw(**self.online_settings)
+        self.data = TrackingData()
+        self.mode = "recording"
+
+    def end_trial(self):
+        """Save the trial in the background and set up the next one; False when the experiment is over"""
+        self.mode = "pause"
+        online = self.online
+        self.last_fit = (online.betaCV, online.r2CV, online.betaCA, online.r2CA) if online.n else None
+        freq = frequencies[self.current_trial_params["freq_index"]]
+        beta = betas[self.current_trial_params["beta_index"]]
+        trial_filename = f"{self.folder_path}/{self.experiment_phase}_trial_{self.trial_index+1}_freq_{freq:.3f}_beta_{beta:.3f}.json"
+        self.data.set_pen(self.input_device.samples.snapshot())
+        self.data.frames = self.scheduler.timings()
+        self.trial_timings.append(self.data.frames)
+
+        self.writer.submit(self.data, trial_filename)
+
+        # Move to next trial
+        self.trial_index += 1
+        return self.setup_next_trial()
+
+    def draw_pause(self):
+        screen, font, small_font = self.screen, self.font, self.small_font
         # Display different instructions based on experiment phase
-        if experiment_phase == "training":
-            draw_centered_text(screen, f"Training Trial {trial_index+1}/{len(training)}", font, WHITE, -100)
+        if self.experiment_phase == "training":
+            draw_centered_text(screen, f"Training Trial {self.trial_index+1}/{len(training)}", font, WHITE, -100)
         else:
-            draw_centered_text(screen, f"Recording Trial {trial_index+1}/{len(recording_trials)}", font, WHITE, -100)
+            draw_centered_text(screen, f"Recording Trial {self.trial_index+1}/{len(self.recording_trials)}", font, WHITE, -100)
 
         # Instructions
         draw_centered_text(screen, "Press SPACE to start a 30-second trial", font, WHITE, 0)
-        
+
         # Show parameters of the upcoming trial
-        freq = frequencies[current_trial_params["freq_index"]]
-        beta = betas[current_trial_params["beta_index"]]
+        freq = frequencies[self.current_trial_params["freq_index"]]
+        beta = betas[self.current_trial_params["beta_index"]]
         param_text = f"Frequency: {freq:.2f}, Beta: {beta}"
         draw_centered_text(screen, param_text, small_font, YELLOW, 100)
-    
-    elif mode == "recording":
-        # Check if trial should end (30 second limit)
-        current_trial_time = perf_counter() - trial_start_time
-        if current_trial_time >= TRIAL_DURATION:
-            # Save this trial's data
-            trial_filename = f"{folder_path}/{experiment_phase}_trial_{trial_index+1}_freq_{freq:.3f}_beta_{beta:.3f}.json"
-            data.pen.xs = input_device.xs[:]
-            data.pen.ys = input_device.ys[:]
-            data.pen.ts = input_device.times[:]
-            data.data = input_device.data
-
-            data.save_to_file(trial_filename)
-            
-            # Move to next trial
-            trial_index += 1
-            if not setup_next_trial():
-                # No more trials, end experiment
-                running = False
-            
-            # Back to pause mode
-            mode = "pause"
-            continue
-        
-        # Draw time remaining
-        time_left = max(0, TRIAL_DURATION - current_trial_time)
-        time_text = f"Time: {time_left:.1f}s"
-        phase_text = f"{experiment_phase.capitalize()} Trial {trial_index+1}"
-        
-        #time_surface = small_font.render(time_text, True, WHITE)
-        #phase_surface = small_font.render(phase_text, True, WHITE)
-        #screen.blit(time_surface, (50, 50))
-        #screen.blit(phase_surface, (50, 90))
-        
+        if self.last_fit is not None:
+            qc_text = "Last trial: betaCV {:.2f} (r2 {:.2f}), betaCA {:.2f} (r2 {:.2f})".format(*self.last_fit)
+            draw_centered_text(screen, qc_text, small_font, WHITE, 160)
+        if self.save_errors:
+            draw_centered_text(screen, f"Saving failed: {', '.join(self.save_errors)}", small_font, RED, 220)
+
+    def draw_recording(self, current_trial_time):
+        screen, input_device = self.screen, self.input_device
+        center_x, center_y = self.center_x, self.center_y
+        qc_surface = self.small_font.render(f"betaCV {self.online.betaCV:.2f}  r2 {self.online.r2CV:.2f}", True, WHITE)
+        screen.blit(qc_surface, (50, self.HEIGHT - 80))
+
         # Draw ellipse path
-        pygame.draw.ellipse(screen, WHITE, (center_x - ellipse_width, 
-                                       center_y - ellipse_height, 
-                                       ellipse_width*2, 
+        pygame.draw.ellipse(screen, WHITE, (center_x - ellipse_width,
+                                       center_y - ellipse_height,
+                                       ellipse_width*2,
                                        ellipse_height*2), 2)
-        
-        # Get current target position
-        current_time = perf_counter() - trial_start_time  # Use trial time for consistent animation
-        tx = int(center_x + target_t.xf(current_time))
-        ty = int(center_y + target_t.yf(current_time))
-        
+
+        # Get current target position (trial time for consistent animation)
+        target_x, target_y = self.target_t.position(current_trial_time)
+        tx = int(center_x + target_x)
+        ty = int(center_y + target_y)
+
         # Get input device position (tablet or mouse)
-        if isinstance(input_device, Tablet):
-            cx = int((input_device.x / 50800) * WIDTH)
-            cy = int((input_device.y / 31750) * HEIGHT)
+        if isinstance(input_device, TABLET_DEVICES):
+            cx = int((input_device.x / 50800) * self.WIDTH)
+            cy = int((input_device.y / 31750) * self.HEIGHT)
         else:  # MouseFallback
             cx = input_device.x
             cy = input_device.y
@@ -278,36 +286,108 @@ while running:
         # Draw target and cursor
         pygame.draw.circle(screen, RED, (int(tx), int(ty)), circle_radius)
         pygame.draw.circle(screen, GREEN, (int(cx), int(cy)), int(circle_radius*0.8))
-        
+
         # Record data
-        t = perf_counter() - trial_start_time
-        #dt = t - last_time
-        #last_time = t
-        data.target.add(tx, ty, t)
-        data.cursor.add(cx, cy, t)
-
-        # Update display and maintain frame rate
-    pygame.display.flip()
-    while (perf_counter() - last_time) < (1.0/60.0):
-        time.sleep(1e-7)
-    last_time = perf_counter()    
-    #clock.tick(60)
-
-
-# Save a summary file with experiment settings
-experiment_summary = {
-    "training_trials": training,
-    "recording_trials": recording_trials,
-    "frequencies": frequencies.tolist(),
-    "betas": betas,
-    "completion_time": time.strftime("%Y-%m-%d %H:%M:%S")
-}
-
-
-with open(folder_path + "/experiment_summary.json", "w") as f:
-    json.dump(experiment_summary, f)
-
-print("Experiment completed. All data saved.")
-pygame.quit()
-input_device.close()
-sys.exit()
+        t = self.clock() - self.trial_start_time
+        self.data.target.add(tx, ty, t)
+        self.data.cursor.add(cx, cy, t)
+
+    def run(self):
+        """Run the experiment until all trials are recorded or the window is closed"""
+        scheduler = self.scheduler
+        # Initialize the first trial
+        running = self.setup_next_trial()
+        while running:
+            # Check if trial should end (30 second limit), between frames so that its timings only hold complete frames
+            if self.mode == "recording" and self.clock() - self.trial_start_time >= self.trial_duration:
+                running = self.end_trial()
+                if not running: break  # No more trials, end experiment
+            scheduler.begin_frame()
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        running = False
+                    elif event.key == pygame.K_SPACE:
+                        if self.mode == "pause": self.start_trial()
+                    elif event.key == pygame.K_BACKSPACE and self.mode == "recording":
+                        # Abort the current trial without saving; it is repeated after the pause
+                        print(f"Trial aborted (betaCV={self.online.betaCV:.2f}, r2CV={self.online.r2CV:.2f})")
+                        self.mode = "pause"
+            if self.auto_start and self.mode == "pause": self.start_trial()
+
+            for failed_file, error in self.writer.poll_errors():
+                print(f"Error saving tracking data to {failed_file}: {error}")
+                self.save_errors.append(failed_file)
+
+            self.screen.fill(BLACK)
+
+            # Poll input devices that are not event driven (mouse fallback, replay)
+            if hasattr(self.input_device, "update"):
+                self.input_device.update()
+
+            if self.mode == "pause":
+                self.draw_pause()
+
+            elif self.mode == "recording":
+                self.draw_recording(self.clock() - self.trial_start_time)
+
+            # Update display and maintain frame rate
+            scheduler.rendered()
+            pygame.display.flip()
+            scheduler.flipped()
+            scheduler.wait()
+
+        self.finish()
+
+    def finish(self):
+        # Wait for the trial files still being written
+        self.writer.close()
+        for failed_file, error in self.writer.poll_errors():
+            print(f"Error saving tracking data to {failed_file}: {error}")
+
+        # Save a summary file with experiment settings
+        experiment_summary = {
+            "training_trials": training,
+            "recording_trials": self.recording_trials,
+            "frequencies": frequencies.tolist(),
+            "betas": betas,
+            "completion_time": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+        with open(self.folder_path + "/experiment_summary.json", "w") as f:
+            json.dump(experiment_summary, f)
+
+        print("Experiment completed. All data saved.")
+
+
+def main():
+    if sys.platform == "win32":
+        ctypes.windll.user32.SetProcessDPIAware()  # important for correct resolution of the screen
+
+    folder_path = create_next_p_directory()
+
+    # Initialize pygame
+    pygame.init()
+    pygame.mouse.set_visible(False)
+    WIDTH, HEIGHT = 3200, 2000
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), vsync=True, flags=pygame.FULLSCREEN | pygame.DOUBLEBUF)
+
+    # Try to initialize tablet, fall back to mouse if not available
+    try:
+        input_device = Tablet()
+        if input_device.device is None:
+            raise Exception("No tablet device found")
+    except Exception as e:
+        print(f"Tablet initialization failed: {e}")
+        input_device = MouseFallback()
+
+    ExperimentSession(screen, input_device, folder_path).run()
+    pygame.quit()
+    input_device.close()
+    sys.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class SampleBuffer:
+    """Preallocated, growable buffer of (t, x, y, pressure) samples with one writer and one reader thread.
+
+    The writer stores a sample in the next free column and only then publishes it by
+    incrementing count. When the buffer is full it is copied into one twice as large,
+    and the new buffer is swapped in before count moves past the old capacity. A
+    reader takes count first and the buffer second, so every column it reads is
+    complete. Start over with renewed() instead of clearing a buffer in use."""
+    FIELDS = ("t", "x", "y", "pressure")
+
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.count = 0
+        self.buffer = np.empty((len(self.FIELDS), capacity))
+
+    def renewed(self):
+        """Empty buffer with room for as many samples as this one holds. Swapping the reference
+           to it (rather than clearing this one) keeps earlier snapshots valid, and a sample the
+           writer adds during the swap lands in the old buffer instead of corrupting the new one."""
+        return SampleBuffer(max(self.capacity, self.count))
+
+    def append(self, t, x, y, pressure=0):
+        """Add a sample; only to be called from the writer thread"""
+        n = self.count
+        buffer = self.buffer
+        if n == buffer.shape[1]:
+            grown = np.empty((buffer.shape[0], 2 * n))
+            grown[:, :n] = buffer
+            self.buffer = buffer = grown
+        buffer[0, n] = t
+        buffer[1, n] = x
+        buffer[2, n] = y
+        buffer[3, n] = pressure
+        self.count = n + 1
+
+    def __len__(self):
+        return self.count
+
+    def snapshot(self):
+        """View of the samples written so far, shape (4, n) with rows t, x, y, pressure; no copy is made"""
+        n = self.count
+        return self.buffer[:, :n]
+
+    def column(self, name):
+        return self.snapshot()[self.FIELDS.index(name)]
@@ -0,0 +1,81 @@
+""" Sensitivity of the power law fits to the analysis parameters.
+
+Work is shared across the grid: every trial is resampled once, filtered once per
+(smooth, filter_order), differentiated once per filter setting, and every cut,
+rlim and regression type is then applied to slices of the same log arrays.
+
+    python sweep.py --smooth 5 10 15 --cut 5,2 2,2 --rlim 0.5,80 0.1,200 --orthogonal both -o sweep.csv
+"""
+import argparse
+import glob
+import itertools
+import pandas as pd
+from trajectory_analysis import Trajectory, cut_slice, fit_power_laws
+from trials import load_pen, parse_trial_filename
+
+RESULT_COLUMNS = ["betaCA", "offsetCA", "r2CA", "betaCV", "offsetCV", "r2CV", "betaRV", "offsetRV", "r2RV"]
+
+
+def sweep_trajectory(rawx, rawy, rawt, dt=0.005, smooths=(10,), filter_orders=(2,), cuts=([5, 2],),
+                     rlims=([0.5, 80],), orthogonals=(False,)):
+    """One row per grid point for a single raw trace"""
+    base = Trajectory(rawx, rawy, rawt, dt=dt)
+    rows = []
+    # filter_order has no effect without smoothing
+    filters = dict.fromkeys((smooth, order) if smooth else (None, None)
+                            for smooth, order in itertools.product(smooths, filter_orders))
+    for smooth, filter_order in filters:
+        tr = base.filtered(smooth, filter_order) if smooth else base
+        logs = tr.logs
+        for cut in cuts:
+            keep = cut_slice(len(tr.t), cut, dt)
+            cut_logs = {name: values[keep] for name, values in logs.items()}
+            start_cut, end_cut = (cut[0], cut[1]) if isinstance(cut, (list, tuple)) else (cut, cut)
+            for rlim, orthogonal in itertools.product(rlims, orthogonals):
+                fit = fit_power_laws(cut_logs, rlim=rlim, orthogonal=orthogonal)
+                row = {"smooth": smooth, "filter_order": filter_order,
+                       "cut_start": start_cut, "cut_end": end_cut,
+                       "rmin": rlim[0] if rlim else None, "rmax": rlim[1] if rlim else None,
+                       "orthogonal": orthogonal, "n": int(fit.mask.sum())}
+                row.update({name: getattr(fit, name) for name in RESULT_COLUMNS})
+                rows.append(row)
+    return rows
+
+
+def sweep(files, dt=0.005, **grid):
+    """Tidy table of fits for every trial file and grid point (see sweep_trajectory for the grid)"""
+    rows = []
+    for filename in files:
+        info = parse_trial_filename(filename)
+        info["file"] = filename
+        for row in sweep_trajectory(*load_pen(filename), dt=dt, **grid):
+            rows.append({**info, **row})
+    return pd.DataFrame(rows)
+
+
+def pair(text):
+    return [float(v) for v in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="trial files (default: P*/recording_trial*.json)")
+    parser.add_argument("--dt", type=float, default=0.005)
+    parser.add_argument("--smooth", type=float, nargs="+", default=[10])
+    parser.add_argument("--filter-order", type=int, nargs="+", default=[2])
+    parser.add_argument("--cut", type=pair, nargs="+", default=[[5, 2]], help="start,end in seconds")
+    parser.add_argument("--rlim", type=pair, nargs="+", default=[[0.5, 80]], help="rmin,rmax")
+    parser.add_argument("--orthogonal", choices=["no", "yes", "both"], default="no")
+    parser.add_argument("-o", "--output", default="sweep.csv")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob("P[0-9]*/recording_trial*.json"))
+    orthogonals = {"no": (False,), "yes": (True,), "both": (False, True)}[args.orthogonal]
+    table = sweep(files, dt=args.dt, smooths=args.smooth, filter_orders=args.filter_order,
+                  cuts=args.cut, rlims=args.rlim, orthogonals=orthogonals)
+    table.to_csv(args.output, index=False)
+    print(f"{len(table)} rows from {len(files)} trials saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 
 import time
 from time import perf_counter
+from sample_buffer import SampleBuffer
 try:
     from pywinusb import hid
 except ImportError:
@@ -10,8 +11,10 @@ except ImportError:
 
 class Tablet:
     def __init__(self):
+        self.samples = SampleBuffer()
         self.reset_data()
         self.device = None
+        self.on_sample = None  # optional callback(x, y, t), called from the HID thread
         
         if hid is None:
             print("pywinusb module not available. Tablet functionality will not work.")
@@ -28,14 +31,23 @@ class Tablet:
     def reset_data(self):
         """Reset all tracking data"""
         self.start_time = perf_counter()
-        self.xs = []
-        self.ys = []
-        self.times = []
+        self.samples = self.samples.renewed()
         self.x = 0
         self.y = 0
-        self.pressures = []
         self.pressure = 0
-        self.data = []
+
+    # views of the recorded samples, kept for the list-based code that read these attributes
+    @property
+    def xs(self): return self.samples.column("x")
+
+    @property
+    def ys(self): return self.samples.column("y")
+
+    @property
+    def times(self): return self.samples.column("t")
+
+    @property
+    def pressures(self): return self.samples.column("pressure")
 
     def close(self):
         """Close the device connection if one exists"""
@@ -53,14 +65,9 @@ class Tablet:
         if len(data) >= 8:            
             self.x = (data[3] << 8) | data[2]
             self.y = (data[5] << 8) | data[4]
-            pressure = (data[7] << 8) | data[6]
-            self.xs.append(self.x)
-            self.ys.append(self.y)
-            self.pressures.append(pressure)
-            self.times.append(t)
-            self.data.append({"x":self.x, "y":self.y, "t":t})
-        if (len(self.xs) != len(self.ys)):
-            print("different length", len(self.x), len(self.y))
+            self.pressure = (data[7] << 8) | data[6]
+            self.samples.append(t, self.x, self.y, self.pressure)
+            if self.on_sample: self.on_sample(self.x, self.y, t)
 
     def find_and_connect_tablet(self):
         """Find the Huion tablet and connect to it"""
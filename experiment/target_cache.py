@@ -0,0 +1,89 @@
+""" Target trajectories of the experiment, precomputed and cached on disk.
+
+A target is an ellipse retracked to a given betaCV. Building one takes two full
+Trajectory constructions, so the targets of the whole design grid are built ahead of
+time and stored as uniform-time lookup tables, keyed by (radii, freq, beta, duration,
+dt) and the version of the analysis code. During a trial the target position is a
+linear interpolation between two table entries, with no spline evaluation.
+
+    python target_cache.py     # build the cache for the run_experiment design grid
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from result_cache import code_version
+from trajectory_analysis import Trajectory
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "target_cache")
+
+
+def generate_target_trajectory(ra, rb, freq, beta, duration, dt=0.001):
+    ts = np.arange(int(duration/dt)) * dt
+    xs = ra * np.cos(ts * freq * np.pi * 2)
+    ys = rb * np.sin(ts * freq * np.pi * 2)
+    tr = Trajectory(xs, ys, ts, dt=dt)
+    return tr.retrack(target_betaCV=beta)
+
+
+class TargetTable:
+    """Target positions sampled every dt seconds from t = 0"""
+    def __init__(self, xs, ys, dt):
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.dt = dt
+        self.last = len(self.xs) - 1
+
+    @classmethod
+    def from_trajectory(cls, tr, duration, dt):
+        ts = np.arange(int(round(duration / dt)) + 1) * dt
+        return cls(tr.xf(ts), tr.yf(ts), dt)
+
+    def position(self, t):
+        """Linearly interpolated (x, y) at time t, held at the ends of the table"""
+        i = t / self.dt
+        if i <= 0: return self.xs[0], self.ys[0]
+        if i >= self.last: return self.xs[self.last], self.ys[self.last]
+        i0 = int(i)
+        w = i - i0
+        return (self.xs[i0] + w * (self.xs[i0 + 1] - self.xs[i0]),
+                self.ys[i0] + w * (self.ys[i0 + 1] - self.ys[i0]))
+
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, xs=self.xs, ys=self.ys, dt=self.dt)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            return cls(d["xs"], d["ys"], float(d["dt"]))
+
+
+def cache_path(ra, rb, freq, beta, duration, dt, cache_dir=CACHE_DIR):
+    params = json.dumps([ra, rb, float(freq), float(beta), duration, dt])
+    key = hashlib.sha256((params + code_version()).encode()).hexdigest()[:24]
+    return os.path.join(cache_dir, f"target_{key}.npz")
+
+
+def load_target(ra, rb, freq, beta, duration, dt=0.001, cache_dir=CACHE_DIR):
+    """Lookup table of a retracked target, built and stored on the first request"""
+    path = cache_path(ra, rb, freq, beta, duration, dt, cache_dir)
+    if os.path.exists(path):
+        return TargetTable.load(path)
+    table = TargetTable.from_trajectory(generate_target_trajectory(ra, rb, freq, beta, duration, dt), duration, dt)
+    os.makedirs(cache_dir, exist_ok=True)
+    table.save(path)
+    return table
+
+
+def load_design_grid(ra, rb, frequencies, betas, duration, dt=0.001, cache_dir=CACHE_DIR):
+    """Tables of all targets, keyed by (freq_index, beta_index)"""
+    return {(i, j): load_target(ra, rb, freq, beta, duration, dt, cache_dir)
+            for i, freq in enumerate(frequencies) for j, beta in enumerate(betas)}
+
+
+if __name__ == "__main__":
+    # design of run_experiment.py
+    grid = load_design_grid(1000, 500, np.geomspace(0.033, 1.2, 5), [0, -1/3, -2/3], 35)
+    print(f"{len(grid)} targets cached in {CACHE_DIR}")
@@ -1,4 +1,7 @@
 import json
+import queue
+import threading
+from time import perf_counter
 import numpy as np
 from collections import namedtuple
 
@@ -18,15 +21,27 @@ class Trajectory:
         self.ts.append(t)
 
 
+def as_list(values):
+    """JSON-serializable list from a list or a numpy array"""
+    return values.tolist() if isinstance(values, np.ndarray) else values
+
+
 class TrackingData:
     """Class to manage tracking data for the experiment"""
     def __init__(self):
         self.cursor = Trajectory()  # User cursor position
         self.target = Trajectory()  # Target position
         self.pen = Trajectory()     # Raw pen/mouse data
+        self.pen.pressures = []
+        self.data = []              # per-sample dicts, only written if set
+        self.frames = None          # FrameScheduler.timings() of the trial, if recorded
 
-    def save_to_file(self, filename):
-        """Save all tracking data to a JSON file"""
+    def set_pen(self, samples):
+        """Use a SampleBuffer snapshot (rows t, x, y, pressure) as the pen data, without copying"""
+        self.pen.ts, self.pen.xs, self.pen.ys, self.pen.pressures = samples
+
+    def to_dict(self):
+        """All tracking data as JSON-serializable dict"""
         data = {
             "cursor": {
                 "xs": self.cursor.xs,
@@ -39,16 +54,87 @@ class TrackingData:
                 "ts": self.target.ts,
             },
             "pen": {
-                "xs": self.pen.xs,
-                "ys": self.pen.ys,
-                "ts": self.pen.ts,
+                "xs": as_list(self.pen.xs),
+                "ys": as_list(self.pen.ys),
+                "ts": as_list(self.pen.ts),
+                "pressures": as_list(self.pen.pressures),
             },            
-            "data": self.data            
         }
+        if self.data: data["data"] = self.data
+        if self.frames: data["frames"] = self.frames
+        return data
 
+    def write(self, filename):
+        """Write all tracking data to a JSON file, raising on failure"""
+        with open(filename, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    def save_to_file(self, filename):
+        """Save all tracking data to a JSON file"""
         try:
-            with open(filename, "w") as f:
-                json.dump(data, f)
+            self.write(filename)
             print(f"Successfully saved tracking data to {filename}")
         except Exception as e:
             print(f"Error saving tracking data: {e}")
+
+
+class TrialWriter:
+    """Saves TrackingData on a background thread so the render loop never waits for the disk.
+       Failed saves are collected for the main loop to pick up with poll_errors()."""
+    def __init__(self, max_pending=4, full_timeout=1.0):
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.full_timeout = full_timeout
+        self.errors = queue.Queue()
+        self.saved = []  # (filename, seconds from submit to written)
+        self.thread = threading.Thread(target=self.run, name="TrialWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, data, filename):
+        """Queue data for saving. If too many saves are pending, wait up to full_timeout seconds
+           for room, then write it on the calling thread; returns False only if that write failed."""
+        submitted = perf_counter()
+        try:
+            self.pending.put((data, filename, submitted), timeout=self.full_timeout)
+            return True
+        except queue.Full:
+            pass
+        try:
+            data.write(filename)
+        except Exception as e:
+            self.errors.put((filename, e))
+            return False
+        self.saved.append((filename, perf_counter() - submitted))
+        print(f"Successfully saved tracking data to {filename} (save queue was full)")
+        return True
+
+    def run(self):
+        while True:
+            item = self.pending.get()
+            try:
+                if item is None: return
+                data, filename, submitted = item
+                data.write(filename)
+                self.saved.append((filename, perf_counter() - submitted))
+                print(f"Successfully saved tracking data to {filename}")
+            except Exception as e:
+                self.errors.put((filename, e))
+            finally:
+                self.pending.task_done()
+
+    def poll_errors(self):
+        """(filename, exception) of every save that failed since the last call"""
+        errors = []
+        while True:
+            try:
+                errors.append(self.errors.get_nowait())
+            except queue.Empty:
+                return errors
+
+    def flush(self):
+        """Block until every queued save is written"""
+        self.pending.join()
+
+    def close(self):
+        """Write the remaining saves and stop the writer thread"""
+        self.pending.put(None)
+        self.thread.join()
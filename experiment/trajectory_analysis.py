@@ -1,110 +1,308 @@
+import copy
 import numpy as np
+from functools import cached_property
+from collections import namedtuple
 import matplotlib.pyplot as plt
 import scipy.interpolate as interpolate
 import scipy.signal as signal
 import scipy.stats as stats
-from util import orthogonal_regression
+from util import orthogonal_regression, batch_linregress, tls_regression, moments_from_sums, linregress_from_moments, tls_from_moments, interp_rows, derivative
+
+
+def cut_slice(n, cut, dt):
+    """ slice that drops cut seconds from the start and end of n samples, as in Trajectory.cutit """
+    if isinstance(cut, (list, tuple)):
+        start_cut, end_cut = cut[0], cut[1]
+    elif type(cut) == type(1):
+        start_cut = end_cut = cut
+    else:
+        start_cut = end_cut = 0
+    return slice(int(start_cut / dt), n - 1 - int(end_cut / dt))
+
+
+PowerLawFit = namedtuple("PowerLawFit", ["betaCA", "offsetCA", "r2CA",
+                                         "betaCV", "offsetCV", "r2CV",
+                                         "betaRV", "offsetRV", "r2RV",
+                                         "mask", "logC", "logV", "logA", "logR"])
+
+
+def regress(x, y, orthogonal=False):
+    """ beta, offset and r2 of y = beta * x + offset """
+    if orthogonal:
+        res = orthogonal_regression(x, y)
+        return res["beta"], res["offset"], res["r2"]
+    beta, offset, r, p_v, std_err = stats.linregress(x, y)
+    return beta, offset, r ** 2
+
+
+WindowedFit = namedtuple("WindowedFit", ["t", "n",
+                                         "betaCA", "offsetCA", "r2CA",
+                                         "betaCV", "offsetCV", "r2CV",
+                                         "betaRV", "offsetRV", "r2RV"])
+
+CycleFit = namedtuple("CycleFit", ["start", "stop", "t", "period", "length", "n",
+                                   "betaCA", "offsetCA", "r2CA",
+                                   "betaCV", "offsetCV", "r2CV",
+                                   "betaRV", "offsetRV", "r2RV"])
+
+
+def fit_mask(logs, rlim=None):
+    """ samples used in the fits: finite, and with R inside rlim if it is set """
+    mask = logs["finite"]
+    # if rlim is set, remove extreme R's
+    if rlim:
+        rmin, rmax = rlim
+        with np.errstate(invalid="ignore"):
+            mask = mask & (logs["R"] < rmax) & (logs["R"] > rmin)
+    return np.array(mask)
+
+
+def fit_power_laws(logs, rlim=None, orthogonal=False):
+    """ CA, CV and RV fits on a dict of log arrays as built by Trajectory.logs """
+    mask = fit_mask(logs, rlim)
+    mask.flags.writeable = False
+    kept = {}
+    for name in ("logC", "logV", "logA", "logR"):
+        kept[name] = logs[name][mask]
+        kept[name].flags.writeable = False
+
+    betaCA, offsetCA, r2CA = regress(kept["logC"], kept["logA"], orthogonal)
+    betaCV, offsetCV, r2CV = regress(kept["logC"], kept["logV"], orthogonal)
+    betaRV, offsetRV, r2RV = regress(kept["logR"], kept["logV"], orthogonal)
+    return PowerLawFit(betaCA, offsetCA, r2CA, betaCV, offsetCV, r2CV, betaRV, offsetRV, r2RV,
+                       mask, kept["logC"], kept["logV"], kept["logA"], kept["logR"])
+
+
+def segment_power_laws(logs, mask, segment_sums, orthogonal=False, min_samples=10):
+    """ CA, CV and RV fits of many segments at once; segment_sums(a) sums an array over each
+        segment. Samples outside mask are left out, and segments with fewer than min_samples
+        kept samples are NaN. Returns the kept sample counts and a dict of (beta, offset, r2). """
+    n = segment_sums(mask.astype(float))
+    # centred on the mean of the kept samples to keep the sums well conditioned
+    centred = {}
+    for name in ("logC", "logV", "logA", "logR"):
+        mean = logs[name][mask].mean() if mask.any() else 0.0
+        centred[name] = (mean, np.where(mask, logs[name] - mean, 0.0))
+    sums = {name: segment_sums(c) for name, (m, c) in centred.items()}
+    squares = {name: segment_sums(c * c) for name, (m, c) in centred.items()}
+
+    fits = {}
+    regression = tls_from_moments if orthogonal else linregress_from_moments
+    for pair, xname, yname in (("CA", "logC", "logA"), ("CV", "logC", "logV"), ("RV", "logR", "logV")):
+        (mx, cx), (my, cy) = centred[xname], centred[yname]
+        moments = moments_from_sums(n, sums[xname], sums[yname], squares[xname], segment_sums(cx * cy), squares[yname])
+        beta, offset, r2 = regression(*moments)
+        offset = offset + my - beta * mx
+        few = n < min_samples
+        fits[pair] = [np.where(few, np.nan, v) for v in (beta, offset, r2)]
+    return n.astype(int), fits
+
+
+def windowed_power_laws(t, logs, window, hop=1, rlim=None, orthogonal=False, min_samples=10):
+    """ CA, CV and RV fits in windows of window samples every hop samples; window sums
+        are differences of prefix sums, so all windows together cost O(N). """
+    starts = np.arange(0, len(t) - window + 1, hop)
+    stops = starts + window
+
+    def window_sums(a):
+        prefix = np.zeros(len(a) + 1)
+        np.cumsum(a, out=prefix[1:])
+        return prefix[stops] - prefix[starts]
+
+    n, fits = segment_power_laws(logs, fit_mask(logs, rlim), window_sums, orthogonal, min_samples)
+    return WindowedFit((t[starts] + t[stops - 1]) / 2, n, *fits["CA"], *fits["CV"], *fits["RV"])
+
+
+def cycle_edges(phase):
+    """ first sample of each cycle of a phase in cycles: where it first passes a new integer,
+        and sample 0 if the phase starts on one. Backward jitter around a crossing does not
+        start a new cycle. """
+    k = np.maximum.accumulate(np.floor(phase))
+    edges = np.flatnonzero(np.diff(k) > 0) + 1
+    if len(phase) and phase[0] == np.floor(phase[0]): edges = np.concatenate(([0], edges))
+    return edges
+
+
+def cycle_power_laws(t, logs, ds, edges, rlim=None, orthogonal=False, min_samples=10):
+    """ CA, CV and RV fits, period and path length of each cycle between consecutive edges,
+        all cycles in one np.add.reduceat pass per sum """
+    edges = np.asarray(edges, dtype=int)
+    if len(edges) < 2: edges = np.zeros(0, dtype=int)
+
+    def cycle_sums(a):
+        return np.add.reduceat(a, edges)[:-1] if len(edges) else np.zeros(0)
+
+    n, fits = segment_power_laws(logs, fit_mask(logs, rlim), cycle_sums, orthogonal, min_samples)
+    start, stop = edges[:-1], edges[1:]
+    return CycleFit(start, stop, t[start], t[stop] - t[start], cycle_sums(ds), n,
+                    *fits["CA"], *fits["CV"], *fits["RV"])
+
 
 class Trajectory:
-    def __init__(s, rawx, rawy, rawt, dt = 0.005, smooth=None, filter_order=2, cut = None, interpolate_order=3):
+    # kinematic quantities computed on first access and cached on the instance
+    derived = ("xvel", "yvel", "V", "xacc", "yacc", "xjerk", "yjerk", "J", "alpha", "D", "R", "C", "A", "ds", "logs")
+
+    def __init__(s, rawx, rawy, rawt, dt = 0.005, smooth=None, filter_order=2, cut = None, interpolate_order=3, compute=(),
+                 derivative="spline", derivative_options=None, grid=None):
         s.rawx = np.asarray(rawx)
         s.rawy = np.asarray(rawy)
         s.rawt = np.asarray(rawt)
         s.dt = dt
+        # "spline" differentiates the splines; "savgol" and "diff" work on the uniformly sampled s.x and s.y
+        s.derivative = derivative
+        s.derivative_options = derivative_options or {}
         s.xf = interpolate.UnivariateSpline(s.rawt, s.rawx, k=interpolate_order, s=0, ext=0)
         s.yf = interpolate.UnivariateSpline(s.rawt, s.rawy, k=interpolate_order, s=0, ext=0)
-        s.t = s.rawt[0] + np.arange(len(rawt)) * s.dt 
+        # the uniform sample times; a given grid (e.g. one chunk of a longer recording) must be spaced dt
+        s.t = s.rawt[0] + np.arange(len(rawt)) * s.dt if grid is None else np.asarray(grid, dtype=float)
         s.x = s.xf(s.t)
         s.y = s.yf(s.t)
         if smooth: s.butterworth_filter(cutoff = smooth, filter_order=filter_order)
         if cut: s.cutit(cut)
-        s.xvel = s.xf.derivative(1)(s.t)
-        s.yvel = s.yf.derivative(1)(s.t)
-        s.V = np.sqrt(s.xvel**2.0 + s.yvel**2.0)
+        for name in compute: getattr(s, name)
 
-        if interpolate_order < 2: return
-        
-        s.xacc = s.xf.derivative(2)(s.t)
-        s.yacc = s.yf.derivative(2)(s.t)
-        s.xjerk = s.xf.derivative(3)(s.t)
-        s.yjerk = s.yf.derivative(3)(s.t)
-        s.J = np.sum(np.sqrt(s.xjerk**2 + s.yjerk**2)) * s.dt
-        s.alpha = np.unwrap(np.arctan2(s.yvel, s.xvel))
-        D0 = np.abs(s.yacc * s.xvel - s.xacc * s.yvel)
-        s.D = np.asarray([np.NaN if dd == 0.0 else dd for dd in D0])
-        s.R = (s.V**3.0) / s.D
-        s.C = 1.0 / s.R
-        s.A = s.V / s.R
-        s.ds = s.V * s.dt
+    def forget_derived(s):
+        """ drop cached kinematics so they are recomputed from the current splines and s.t """
+        for name in s.derived: s.__dict__.pop(name, None)
+
+    @cached_property
+    def xf(s): return interpolate.UnivariateSpline(s.t, s.x, k=3, s=0)
+
+    @cached_property
+    def yf(s): return interpolate.UnivariateSpline(s.t, s.y, k=3, s=0)
+
+    def differentiate(s, name, order):
+        """ order-th derivative of s.x or s.y at s.t with the derivative backend """
+        if s.derivative == "spline":
+            return getattr(s, name + "f").derivative(order)(s.t)
+        full_x, full_y, offset = s.__dict__.get("uncut", (s.x, s.y, 0))
+        values = derivative(full_x if name == "x" else full_y, s.dt, order, s.derivative, **s.derivative_options)
+        return values[offset:offset + len(s.t)]
+
+    @cached_property
+    def xvel(s): return s.differentiate("x", 1)
+
+    @cached_property
+    def yvel(s): return s.differentiate("y", 1)
+
+    @cached_property
+    def V(s): return np.sqrt(s.xvel**2.0 + s.yvel**2.0)
+
+    @cached_property
+    def xacc(s): return s.differentiate("x", 2)
+
+    @cached_property
+    def yacc(s): return s.differentiate("y", 2)
+
+    @cached_property
+    def xjerk(s): return s.differentiate("x", 3)
+
+    @cached_property
+    def yjerk(s): return s.differentiate("y", 3)
+
+    @cached_property
+    def J(s): return np.sum(np.sqrt(s.xjerk**2 + s.yjerk**2)) * s.dt
+
+    @cached_property
+    def alpha(s): return np.unwrap(np.arctan2(s.yvel, s.xvel))
+
+    @cached_property
+    def D(s):
+        D = np.abs(s.yacc * s.xvel - s.xacc * s.yvel)
+        D[D == 0.0] = np.nan
+        return D
+
+    @cached_property
+    def R(s): return (s.V**3.0) / s.D
+
+    @cached_property
+    def C(s): return 1.0 / s.R
+
+    @cached_property
+    def A(s): return s.V / s.R
+
+    @cached_property
+    def ds(s): return s.V * s.dt
 
     def butterworth_filter(s, cutoff, filter_order = 2):
         B, A = signal.butter(filter_order, cutoff  * 2 * s.dt, 'low')
         s.x = signal.filtfilt(B, A, s.x)
         s.y = signal.filtfilt(B, A, s.y)
-        s.xf = interpolate.UnivariateSpline(s.t, s.x, k=3, s=0)
-        s.yf = interpolate.UnivariateSpline(s.t, s.y, k=3, s=0)
+        s.__dict__.pop("uncut", None)
+        if s.derivative == "spline":
+            s.xf = interpolate.UnivariateSpline(s.t, s.x, k=3, s=0)
+            s.yf = interpolate.UnivariateSpline(s.t, s.y, k=3, s=0)
+        else:
+            # only built if needed, e.g. by retrack_batch
+            s.__dict__.pop("xf", None)
+            s.__dict__.pop("yf", None)
+        s.forget_derived()
         return s
+
+    def filtered(s, cutoff, filter_order = 2):
+        """ filtered copy sharing the raw data; s and its cached kinematics are left as they are """
+        return copy.copy(s).butterworth_filter(cutoff, filter_order=filter_order)
     
     def cutit(s, cut):
-        if type(cut) == type([1,1]):
-            start_cut = cut[0]
-            end_cut = cut[1]
-        elif type(cut) == type(1):
-            start_cut = cut
-            end_cut = cut
-        else:
-            start_cut = 0
-            end_cut = 0
-        s.x = s.x[int(start_cut / s.dt):  len(s.x) - 1 - int(end_cut / s.dt) ]
-        s.y = s.y[int(start_cut / s.dt):  len(s.y) - 1 - int(end_cut / s.dt) ]
-        s.t = s.t[int(start_cut / s.dt):  len(s.t) - 1 - int(end_cut / s.dt) ]
-        
+        keep = cut_slice(len(s.t), cut, s.dt)
+        if s.derivative != "spline":
+            # differentiate over the uncut samples, as the spline backend does, so the cut ends have no edge effects
+            full_x, full_y, offset = s.__dict__.get("uncut", (s.x, s.y, 0))
+            s.uncut = (full_x, full_y, offset + keep.start)
+        s.x = s.x[keep]
+        s.y = s.y[keep]
+        s.t = s.t[keep]
+        s.forget_derived()
 
 
-    def calc_betas(s, rlim=None, orthogonal=False):
-        
-        # remove NaNs
-        filt = np.isfinite(s.C) & np.isfinite(s.A) & np.isfinite(s.V) & np.isfinite(s.R)        
-        
-        # if rlim is set, remove extreme R's        
-        if rlim:
-            rmin, rmax = rlim            
-            filt = filt & (s.R < rmax) & (s.R > rmin) 
-        
-        s.C = s.C[filt]
-        s.V = s.V[filt]
-        s.A = s.A[filt]
-        s.R = s.R[filt]
-        s.tf = s.t[filt]  ## time variable for ploting with excluded elements
-        s.filt = filt
+    @cached_property
+    def logs(s):
+        """ log10 of C, V, A and R over all samples, shared by every fit """
+        finite = np.isfinite(s.C) & np.isfinite(s.A) & np.isfinite(s.V) & np.isfinite(s.R)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {"finite": finite, "C": s.C, "V": s.V, "A": s.A, "R": s.R,
+                    "logC": np.log10(s.C), "logV": np.log10(s.V), "logA": np.log10(s.A), "logR": np.log10(s.R)}
 
-        s.logC = np.log10(s.C)
-        s.logV = np.log10(s.V)
-        s.logA = np.log10(s.A)
-        s.logR = np.log10(s.R)
-        
-        if orthogonal:
-            CA = orthogonal_regression(s.logC, s.logA)
-            s.betaCA, s.offsetCA, s.r2CA = CA["beta"], CA["offset"], CA["r2"]
-            
-            CV = orthogonal_regression(s.logC, s.logV)
-            s.betaCV, s.offsetCV, s.r2CV = CV["beta"], CV["offset"], CV["r2"]
-            
-            RV = orthogonal_regression(s.logR, s.logV)
-            s.betaRV, s.offsetRV, s.r2RV = RV["beta"], RV["offset"], RV["r2"]
+    def fit(s, rlim=None, orthogonal=False):
+        """ power law fits on the cached log arrays; the kinematic arrays are left untouched """
+        return fit_power_laws(s.logs, rlim=rlim, orthogonal=orthogonal)
 
+    def windowed_betas(s, window, hop=None, rlim=None, orthogonal=False, min_samples=10):
+        """ fits in sliding windows of window seconds every hop seconds (default: every sample),
+            with the window centre times in t """
+        window = int(round(window / s.dt))
+        hop = 1 if hop is None else max(1, int(round(hop / s.dt)))
+        return windowed_power_laws(s.t, s.logs, window, hop, rlim=rlim, orthogonal=orthogonal, min_samples=min_samples)
+
+    def cycle_edges(s, freq=None, t0=0.0):
+        """ first sample of each movement cycle: from the turning of the direction alpha by
+            multiples of 2 pi, or from the phase freq * (t - t0) of a target moving at freq Hz """
+        if freq is None:
+            turned = s.alpha - s.alpha[0]
+            phase = turned * np.sign(turned[-1]) / (2 * np.pi)
         else:
-            
-            s.betaCA, s.offsetCA, rCA, p_v, std_err = stats.linregress(s.logC, s.logA)
-            s.r2CA = rCA ** 2 
+            phase = freq * (s.t - t0)
+        return cycle_edges(phase)
 
-            s.betaCV, s.offsetCV, rCV, p_v, std_err = stats.linregress(s.logC, s.logV)
-            s.r2CV = rCV ** 2
+    def cycle_betas(s, freq=None, t0=0.0, rlim=None, orthogonal=False, min_samples=10):
+        """ fits, period and path length of every complete cycle, see cycle_edges """
+        return cycle_power_laws(s.t, s.logs, s.ds, s.cycle_edges(freq, t0), rlim=rlim, orthogonal=orthogonal,
+                                min_samples=min_samples)
 
-            s.betaRV, s.offsetRV, rRV, p_v, std_err = stats.linregress(s.logR, s.logV)
-            s.r2RV = rRV**2
-        
-        
+    def calc_betas(s, rlim=None, orthogonal=False):
+        fit = s.fit(rlim=rlim, orthogonal=orthogonal)
+        for name, value in fit._asdict().items():
+            if name != "mask": setattr(s, name, value)
+
+        # anything still derived from V is computed over all samples before V is replaced
+        s.ds
+        # kinematics restricted to the fitted samples; refits start again from s.logs
+        s.C = s.logs["C"][fit.mask]
+        s.V = s.logs["V"][fit.mask]
+        s.A = s.logs["A"][fit.mask]
+        s.R = s.logs["R"][fit.mask]
+        s.tf = s.t[fit.mask]  ## time variable for ploting with excluded elements
+        s.filt = fit.mask
         return s
 
     def retrack(s, target_betaCA=None, target_betaCV=None, target_time=None, dt=None):
@@ -119,9 +317,46 @@ class Trajectory:
 
         t0 = np.concatenate(([0], np.cumsum(dts)[:-1]))
         t = s.t[0] + target_time  * (t0  / t0[-1])
-        new_trajectory = Trajectory(np.copy(s.x), np.copy(s.y), t, dt)
+        new_trajectory = Trajectory(np.copy(s.x), np.copy(s.y), t, dt, derivative=s.derivative,
+                                    derivative_options=s.derivative_options)
         return new_trajectory
 
+    def retrack_batch(s, target_betaCA=None, target_betaCV=None, target_time=None, dt=None, kinematics=False):
+        """ retrack to many target betas and target times at once. All warped timelines come from
+            one cumulative sum, and each is mapped back to the original time by a cubic Hermite
+            interpolation on the uniform grid, where the original splines give the positions.
+            Returns the grid t and positions x, y of shape (len(betas), len(s.t)), or with kinematics
+            a TrajectoryBatch of them. Unlike retrack, positions past the end of a shorter target_time
+            are held instead of extrapolated. """
+        if target_betaCA is not None:
+            exponent = np.asarray(target_betaCA, dtype=float) - 1
+        else:
+            exponent = np.asarray(target_betaCV, dtype=float)
+        if dt is None:
+            dt = s.dt
+        if target_time is None:
+            target_time = s.t[-1] - s.t[0]
+        exponent, target_time = np.broadcast_arrays(np.atleast_1d(exponent), np.atleast_1d(np.asarray(target_time, dtype=float)))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dts = np.exp(np.log(s.ds) - exponent[:, None] * np.log(s.C))
+        t0 = np.zeros_like(dts)
+        np.cumsum(dts[:, :-1], axis=1, out=t0[:, 1:])
+        scale = target_time / t0[:, -1]
+        warped = s.t[0] + scale[:, None] * t0
+
+        # rate of the original time along the warped one, at each sample
+        step = scale[:, None] * dts
+        step[:, 1:-1] = (step[:, :-2] + step[:, 1:-1]) / 2
+        step[:, -1] = step[:, -2]
+        grid = s.t[0] + np.arange(len(s.t)) * dt
+        u = interp_rows(grid, warped, s.t, s.dt / step)
+        x = s.xf(u.ravel()).reshape(u.shape)
+        y = s.yf(u.ravel()).reshape(u.shape)
+        if kinematics:
+            return TrajectoryBatch(x, y, dt, t0=s.t[0])
+        return grid, x, y
+
     def logplot(s, ax=None, step=1):
         if (ax == None): fig, ax = plt.subplots()
         ax.plot(s.logC[::step], s.logA[::step], '.', color="gray")
@@ -142,3 +377,120 @@ class Trajectory:
         ax.legend(loc="lower left", frameon=False)
         ax.set_xlabel("log C")
         ax.set_ylabel("log V")    
+
+
+class TrajectoryBatch:
+    """ Kinematics of many traces sampled at a common dt, computed with one spline per
+        group of equal-length traces instead of one Trajectory per trace. Traces are given
+        as a 2D array (one row per trace) or as a list of 1D arrays of any lengths; all
+        per-sample results are NaN-padded 2D arrays with the valid length in s.lengths. """
+    def __init__(s, xs, ys, dt = 0.005, t0=None, smooth=None, filter_order=2, cut = None):
+        xs = [np.asarray(x, dtype=float) for x in xs]
+        ys = [np.asarray(y, dtype=float) for y in ys]
+        s.dt = dt
+        s.count = len(xs)
+        t0 = np.zeros(s.count) if t0 is None else np.broadcast_to(np.asarray(t0, dtype=float), (s.count,))
+        raw_lengths = np.array([len(x) for x in xs])
+        s.lengths = np.array([len(range(n)[cut_slice(n, cut, dt)]) for n in raw_lengths], dtype=int)
+        width = s.lengths.max() if s.count else 0
+
+        names = ["t", "x", "y", "xvel", "yvel", "xacc", "yacc", "xjerk", "yjerk", "alpha", "D", "V", "R", "C", "A", "ds"]
+        for name in names:
+            setattr(s, name, np.full((s.count, width), np.nan))
+        s.J = np.full(s.count, np.nan)
+
+        for n in np.unique(raw_lengths):
+            rows = np.flatnonzero(raw_lengths == n)
+            X = np.stack([xs[i] for i in rows])
+            Y = np.stack([ys[i] for i in rows])
+            t = np.arange(n) * dt
+            if smooth:
+                B, A = signal.butter(filter_order, smooth * 2 * dt, 'low')
+                X = signal.filtfilt(B, A, X, axis=1)
+                Y = signal.filtfilt(B, A, Y, axis=1)
+            keep = cut_slice(n, cut, dt)
+            tc = t[keep]
+            m = len(tc)
+            if m == 0: continue
+            xf = interpolate.CubicSpline(t, X, axis=1, bc_type='not-a-knot')
+            yf = interpolate.CubicSpline(t, Y, axis=1, bc_type='not-a-knot')
+            xvel, yvel = xf(tc, 1), yf(tc, 1)
+            xacc, yacc = xf(tc, 2), yf(tc, 2)
+            xjerk, yjerk = xf(tc, 3), yf(tc, 3)
+            V = np.sqrt(xvel**2.0 + yvel**2.0)
+            D = np.abs(yacc * xvel - xacc * yvel)
+            D[D == 0.0] = np.nan
+            R = (V**3.0) / D
+            group = {"t": t0[rows, None] + tc, "x": X[:, keep], "y": Y[:, keep],
+                     "xvel": xvel, "yvel": yvel, "xacc": xacc, "yacc": yacc,
+                     "xjerk": xjerk, "yjerk": yjerk,
+                     "alpha": np.unwrap(np.arctan2(yvel, xvel), axis=1),
+                     "D": D, "V": V, "R": R, "C": 1.0 / R, "A": V / R, "ds": V * dt}
+            for name in names:
+                getattr(s, name)[rows, :m] = group[name]
+            s.J[rows] = np.sum(np.sqrt(xjerk**2 + yjerk**2), axis=1) * dt
+
+    def __len__(s):
+        return s.count
+
+    def row(s, name, i):
+        """ the valid samples of trace i of a per-sample array """
+        return getattr(s, name)[i, :s.lengths[i]]
+
+    def row_logs(s, i):
+        """ Trajectory.logs of trace i """
+        C, V, A, R = (s.row(name, i) for name in ("C", "V", "A", "R"))
+        finite = np.isfinite(C) & np.isfinite(A) & np.isfinite(V) & np.isfinite(R)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {"finite": finite, "C": C, "V": V, "A": A, "R": R,
+                    "logC": np.log10(C), "logV": np.log10(V), "logA": np.log10(A), "logR": np.log10(R)}
+
+    def windowed_betas(s, window, hop=None, rlim=None, orthogonal=False, min_samples=10):
+        """ Trajectory.windowed_betas of each trace, a list of WindowedFit """
+        window = int(round(window / s.dt))
+        hop = 1 if hop is None else max(1, int(round(hop / s.dt)))
+        return [windowed_power_laws(s.row("t", i), s.row_logs(i), window, hop, rlim=rlim, orthogonal=orthogonal,
+                                    min_samples=min_samples) for i in range(s.count)]
+
+    def cycle_edges(s, freq=None, t0=0.0):
+        """ Trajectory.cycle_edges of each trace, a list of arrays; t0 may differ per trace """
+        t0 = np.broadcast_to(np.asarray(t0, dtype=float), (s.count,))
+        edges = []
+        for i in range(s.count):
+            if freq is None:
+                alpha = s.row("alpha", i)
+                turned = alpha - alpha[0] if len(alpha) else alpha
+                phase = turned * np.sign(turned[-1]) / (2 * np.pi) if len(alpha) else turned
+            else:
+                phase = freq * (s.row("t", i) - t0[i])
+            edges.append(cycle_edges(phase))
+        return edges
+
+    def cycle_betas(s, freq=None, t0=0.0, rlim=None, orthogonal=False, min_samples=10):
+        """ Trajectory.cycle_betas of each trace, a list of CycleFit """
+        return [cycle_power_laws(s.row("t", i), s.row_logs(i), s.row("ds", i), edges, rlim=rlim, orthogonal=orthogonal,
+                                 min_samples=min_samples) for i, edges in enumerate(s.cycle_edges(freq, t0))]
+
+    def calc_betas(s, rlim=None, orthogonal=False):
+        """ per-trace betas, offsets and r2 as arrays; unlike Trajectory.calc_betas the
+            kinematic arrays are left intact and the kept samples are marked in s.filt """
+        filt = np.isfinite(s.C) & np.isfinite(s.A) & np.isfinite(s.V) & np.isfinite(s.R)
+        if rlim:
+            rmin, rmax = rlim
+            with np.errstate(invalid="ignore"):
+                filt = filt & (s.R < rmax) & (s.R > rmin)
+        s.filt = filt
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s.logC = np.where(filt, np.log10(s.C), np.nan)
+            s.logV = np.where(filt, np.log10(s.V), np.nan)
+            s.logA = np.where(filt, np.log10(s.A), np.nan)
+            s.logR = np.where(filt, np.log10(s.R), np.nan)
+
+        pairs = {"CA": (s.logC, s.logA), "CV": (s.logC, s.logV), "RV": (s.logR, s.logV)}
+        for name, (x, y) in pairs.items():
+            beta, offset, r2 = tls_regression(x, y) if orthogonal else batch_linregress(x, y)
+            setattr(s, "beta" + name, beta)
+            setattr(s, "offset" + name, offset)
+            setattr(s, "r2" + name, r2)
+        return s
@@ -0,0 +1,109 @@
+""" Compact binary copies of the trial recordings.
+
+Each P*/<phase>_trial_*.json becomes a directory <out>/P*/<phase>_trial_*.trial with
+pen.npy, cursor.npy and target.npy, each a float64 array of shape (3, n) holding the
+x, y and t rows as recorded (the pen in tablet units), plus meta.json with the trial parameters from the file name and
+experiment_summary.json. Files written by TrialWriter also carry the pen pressures, stored as
+pressures.npy of shape (n,), and the frame timings, stored as frames.npy of shape (3, frames)
+with frame_starts, render_times and flip_times rows and their missed and period in meta.json.
+The redundant "data" block of the JSON files is dropped.
+
+    python trial_store.py [experiment_dir] [out_dir]
+"""
+import glob
+import json
+import os
+import sys
+import numpy as np
+from trials import parse_trial_filename, x_to_cm, y_to_cm
+
+STREAMS = ("pen", "cursor", "target")
+FRAME_ROWS = ("frame_starts", "render_times", "flip_times")
+
+
+def trial_metadata(filename, summary=None):
+    """Metadata of a trial file, with the design indices and order from experiment_summary.json if given"""
+    meta = parse_trial_filename(filename)
+    if summary is not None:
+        key = "recording_trials" if meta["phase"] == "recording" else "training_trials"
+        params = summary[key][meta["trial"] - 1]
+        meta.update({
+            "freq_index": params["freq_index"],
+            "beta_index": params["beta_index"],
+            "freq_value": summary["frequencies"][params["freq_index"]],
+            "beta_value": summary["betas"][params["beta_index"]],
+            "completion_time": summary.get("completion_time"),
+        })
+    return meta
+
+
+def load_summary(participant_dir):
+    path = os.path.join(participant_dir, "experiment_summary.json")
+    if not os.path.exists(path): return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def convert_trial(filename, out_path, summary=None):
+    """Write the binary store of one trial JSON file to out_path"""
+    with open(filename) as f:
+        d = json.load(f)
+    os.makedirs(out_path, exist_ok=True)
+    meta = trial_metadata(filename, summary)
+    for stream in STREAMS:
+        columns = np.array([d[stream]["xs"], d[stream]["ys"], d[stream]["ts"]], dtype=float).reshape(3, -1)
+        np.save(os.path.join(out_path, stream + ".npy"), columns)
+        meta[stream + "_samples"] = columns.shape[1]
+    if d["pen"].get("pressures"):
+        np.save(os.path.join(out_path, "pressures.npy"), np.array(d["pen"]["pressures"], dtype=float))
+    if "frames" in d:
+        frames = np.array([d["frames"][row] for row in FRAME_ROWS], dtype=float).reshape(3, -1)
+        np.save(os.path.join(out_path, "frames.npy"), frames)
+        meta["frames"] = {"count": frames.shape[1], "missed": d["frames"]["missed"], "period": d["frames"]["period"]}
+    with open(os.path.join(out_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return out_path
+
+
+def convert_tree(experiment_dir=".", out_dir="trial_store"):
+    """Convert every P*/ trial file under experiment_dir, returns the written paths"""
+    written = []
+    for participant_dir in sorted(glob.glob(os.path.join(experiment_dir, "P[0-9]*"))):
+        summary = load_summary(participant_dir)
+        for filename in sorted(glob.glob(os.path.join(participant_dir, "*_trial_*.json"))):
+            name = os.path.splitext(os.path.basename(filename))[0] + ".trial"
+            out_path = os.path.join(out_dir, os.path.basename(participant_dir), name)
+            written.append(convert_trial(filename, out_path, summary))
+    return written
+
+
+class StoredTrial:
+    """Trial loaded from the binary store; pen, cursor and target are memory-mapped (3, n) arrays
+       in the units of the JSON files, i.e. tablet units for the pen. Analyses in cm take
+       Trajectory(*trial.pen_cm()), which converts x and y to new arrays. pressures (n,) and
+       frames (3, frames) are also memory-mapped, or None for trials recorded without them."""
+    def __init__(self, path, mmap_mode="r"):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        for stream in STREAMS:
+            setattr(self, stream, np.load(os.path.join(path, stream + ".npy"), mmap_mode=mmap_mode))
+        for name in ("pressures", "frames"):
+            filename = os.path.join(path, name + ".npy")
+            setattr(self, name, np.load(filename, mmap_mode=mmap_mode) if os.path.exists(filename) else None)
+
+    def pen_cm(self):
+        """Pen x and y converted to cm and t, as returned by trials.load_pen"""
+        xs, ys, ts = self.pen
+        return x_to_cm(xs), y_to_cm(ys), ts
+
+
+def load_trial(path, mmap_mode="r"):
+    return StoredTrial(path, mmap_mode=mmap_mode)
+
+
+if __name__ == "__main__":
+    experiment_dir = sys.argv[1] if len(sys.argv) > 1 else "."
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else "trial_store"
+    paths = convert_tree(experiment_dir, out_dir)
+    print(f"Converted {len(paths)} trials to {out_dir}")
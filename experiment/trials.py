@@ -0,0 +1,36 @@
+""" Loading of the tracking experiment recordings, P*/<phase>_trial_<n>_freq_<f>_beta_<b>.json """
+import json
+import os
+import numpy as np
+
+
+def convert_to_cm(tablet_coordinate, device_range, physical_size_cm):
+    device_min, device_max = device_range
+    device_span = device_max - device_min
+    normalized = (tablet_coordinate - device_min) / device_span
+    return normalized * physical_size_cm
+
+def x_to_cm(x): return convert_to_cm(x, [0, 50800], 25.4)    # for Huion 610p tablet
+def y_to_cm(y): return convert_to_cm(y, [0, 31750], 15.88)
+
+
+def parse_trial_filename(filename):
+    """Participant folder, phase, trial number and the freq/beta strings encoded in a trial file name"""
+    spl = os.path.splitext(os.path.basename(filename))[0].split("_")
+    return {
+        "participant": os.path.basename(os.path.dirname(os.path.abspath(filename))),
+        "phase": spl[0],
+        "trial": int(spl[2]),
+        "freq": spl[4],
+        "beta": spl[6],
+    }
+
+
+def load_pen(filename):
+    """Pen samples of a trial file as numpy arrays (x and y in cm, t in s)"""
+    with open(filename) as f:
+        pen = json.load(f)["pen"]
+    xs = x_to_cm(np.asarray(pen["xs"], dtype=float))
+    ys = y_to_cm(np.asarray(pen["ys"], dtype=float))
+    ts = np.asarray(pen["ts"], dtype=float)
+    return xs, ys, ts
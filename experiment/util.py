@@ -2,6 +2,7 @@ import numpy as np
 import scipy.interpolate
 import scipy.signal as signal
 from collections import deque
+from functools import lru_cache
 import scipy.fftpack as fp
 #from numba import njit
 import scipy.odr as odr
@@ -48,7 +49,8 @@ def linear_func(p, x):
     m, c = p
     return m*x + c
 
-def orthogonal_regression(x, y):
+def odr_regression(x, y):
+    """ orthogonal regression with an iterative scipy.odr fit; reference for orthogonal_regression """
     res = odr.ODR(odr.RealData(x, y), odr.Model(linear_func), beta0=[0.,0.]).run()
     yfit = linear_func(res.beta, x)
     my = np.mean(y)
@@ -60,6 +62,101 @@ def orthogonal_regression(x, y):
     # for y = beta*x + offset
     return {"beta": beta, "offset":offset, "r2": r2, "res":res }
 
+def orthogonal_regression(x, y, axis=-1):
+    """ total least squares line y = beta*x + offset, in closed form; x and y may be stacked
+        (NaN-padded) arrays, fitted along axis in one call """
+    beta, offset, r2 = tls_regression(x, y, axis=axis)
+    return {"beta": beta, "offset": offset, "r2": r2}
+
+
+def linregress_from_moments(mx, my, cxx, cxy, cyy):
+    """ OLS of y on x from means and (co)variances, elementwise on arrays """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        beta = cxy / cxx
+        offset = my - beta * mx
+        r2 = cxy * cxy / (cxx * cyy)
+    return beta, offset, r2
+
+def moments_from_sums(n, sx, sy, sxx, sxy, syy):
+    """ means and (co)variances from sums of x, y, x^2, xy, y^2 over n samples """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mx = sx / n
+        my = sy / n
+        cxx = sxx / n - mx * mx
+        cxy = sxy / n - mx * my
+        cyy = syy / n - my * my
+    return mx, my, cxx, cxy, cyy
+
+def linregress_from_sums(n, sx, sy, sxx, sxy, syy):
+    """ OLS of y on x from running sums of x, y, x^2, xy, y^2 """
+    return linregress_from_moments(*moments_from_sums(n, sx, sy, sxx, sxy, syy))
+
+def masked_moments(x, y, axis=-1):
+    """ means and (co)variances along axis, skipping pairs where x or y is not finite """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ok = np.isfinite(x) & np.isfinite(y)
+    n = ok.sum(axis=axis)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mx = np.where(ok, x, 0.0).sum(axis=axis) / n
+        my = np.where(ok, y, 0.0).sum(axis=axis) / n
+        dx = np.where(ok, x - np.expand_dims(mx, axis), 0.0)
+        dy = np.where(ok, y - np.expand_dims(my, axis), 0.0)
+        cxx = (dx * dx).sum(axis=axis) / n
+        cxy = (dx * dy).sum(axis=axis) / n
+        cyy = (dy * dy).sum(axis=axis) / n
+    return n, mx, my, cxx, cxy, cyy
+
+def tls_from_moments(mx, my, cxx, cxy, cyy, delta=1.0):
+    """ Deming regression of y on x from means and (co)variances, elementwise on arrays;
+        delta is the ratio of y to x error variances, 1 for total least squares.
+        r2 = 1 - SS_res/SS_tot of the vertical residuals, as in odr_regression """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d = cyy - delta * cxx
+        root = np.sqrt(d * d + 4 * delta * cxy * cxy)
+        # the two forms of the slope are equal; each avoids cancellation for one sign of d
+        beta = np.where(d >= 0, (d + root) / (2 * cxy), 2 * cxy / (root - d))[()]
+        offset = my - beta * mx
+        r2 = 1.0 - (cyy - 2 * beta * cxy + beta * beta * cxx) / cyy
+    return beta, offset, r2
+
+def batch_linregress(x, y, axis=-1):
+    """ stats.linregress along axis of stacked (NaN-padded) arrays; returns beta, offset, r2 arrays """
+    n, mx, my, cxx, cxy, cyy = masked_moments(x, y, axis)
+    return linregress_from_moments(mx, my, cxx, cxy, cyy)
+
+def tls_regression(x, y, axis=-1, delta=1.0):
+    """ orthogonal (Deming) regression along axis of stacked (NaN-padded) arrays; returns beta, offset, r2 arrays """
+    n, mx, my, cxx, cxy, cyy = masked_moments(x, y, axis)
+    return tls_from_moments(mx, my, cxx, cxy, cyy, delta)
+
+
+def interp_rows(x, xp, fp, dfp=None):
+    """ np.interp of each row of stacked (xp, fp) at the same row of x, held at the ends; one
+        searchsorted over all rows. With the derivatives dfp at xp, cubic Hermite instead of linear. """
+    if np.ndim(xp) == 1: return interp_rows(x, [xp], [fp], None if dfp is None else [dfp])[0]
+    xp = np.atleast_2d(np.asarray(xp, dtype=float))
+    fp = np.broadcast_to(np.asarray(fp, dtype=float), xp.shape)
+    rows, m = xp.shape
+    x = np.broadcast_to(np.asarray(x, dtype=float), (rows,) + np.shape(x)[-1:])
+    x = np.clip(x, xp[:, :1], xp[:, -1:])
+    # rows shifted apart so that one sorted search covers them all
+    start = xp[:, :1]
+    shift = np.arange(rows)[:, None] * (np.max(xp[:, -1:] - start) + 1.0)
+    i = np.searchsorted((xp - start + shift).ravel(), (x - start + shift).ravel(), side="right") - 1
+    row_start = np.repeat(np.arange(rows) * m, x.shape[1])
+    i = np.clip(i, row_start, row_start + m - 2)
+    x0, x1 = xp.ravel()[i], xp.ravel()[i + 1]
+    f0, f1 = fp.ravel()[i], fp.ravel()[i + 1]
+    h = x1 - x0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        w = np.where(h > 0, (x.ravel() - x0) / h, 0.0)
+    if dfp is None:
+        return (f0 + w * (f1 - f0)).reshape(x.shape)
+    dfp = np.broadcast_to(np.asarray(dfp, dtype=float), xp.shape)
+    d0, d1 = dfp.ravel()[i] * h, dfp.ravel()[i + 1] * h
+    w2, w3 = w * w, w * w * w
+    return ((2 * w3 - 3 * w2 + 1) * f0 + (w3 - 2 * w2 + w) * d0 + (-2 * w3 + 3 * w2) * f1 + (w3 - w2) * d1).reshape(x.shape)
 
 class DelayLine():
 	def __init__(self, length, init_value=0):
@@ -122,8 +219,45 @@ def rmse_percent(a, b):
 
 #rmse_percent a, b = (np.asarray([10,10]), np.asarray([5,5]))
 
-def get_vel(ts, xs):
-	return scipy.interpolate.UnivariateSpline(ts, xs, k=3, s=0).derivative(1)(ts)
+DERIVATIVE_METHODS = ("spline", "savgol", "diff")
+
+@lru_cache(maxsize=None)
+def savgol_kernels(window, polyorder, order, dt):
+	""" Savitzky-Golay coefficients for the centre of a window and for each of the first and last
+	    window // 2 positions, where the polynomial fitted to the first or last window is used """
+	h = window // 2
+	coeffs = lambda pos: signal.savgol_coeffs(window, polyorder, deriv=order, delta=dt, pos=pos, use="dot")
+	return (coeffs(h), np.array([coeffs(i) for i in range(h)]),
+	        np.array([coeffs(i) for i in range(window - h, window)]))
+
+def derivative(xs, dt, order=1, method="savgol", window=11, polyorder=5):
+	""" order-th derivative of samples xs spaced dt apart. spline: of the interpolating cubic
+	    spline; savgol: Savitzky-Golay filter of window samples and polynomial order polyorder;
+	    diff: central differences, applied order times (second order accurate at the ends too) """
+	xs = np.asarray(xs, dtype=float)
+	if method == "spline":
+		ts = np.arange(len(xs)) * dt
+		return scipy.interpolate.UnivariateSpline(ts, xs, k=3, s=0).derivative(order)(ts)
+	if method == "savgol":
+		if len(xs) < window: return signal.savgol_filter(xs, window, polyorder, deriv=order, delta=dt)
+		# as signal.savgol_filter(..., mode="interp"), with the filter coefficients computed once
+		centre, left, right = savgol_kernels(window, polyorder, order, dt)
+		h = window // 2
+		out = np.empty_like(xs)
+		out[h:len(xs) - h] = np.convolve(xs, centre[::-1], "valid")
+		out[:h] = left @ xs[:window]
+		out[len(xs) - h:] = right @ xs[-window:]
+		return out
+	if method == "diff":
+		for _ in range(order): xs = np.gradient(xs, dt, edge_order=2)
+		return xs
+	raise ValueError(f"unknown derivative method {method!r}, expected one of {DERIVATIVE_METHODS}")
+
+def get_vel(ts, xs, method="spline", **options):
+	""" velocity of xs at ts; the savgol and diff methods need uniformly spaced ts """
+	if method == "spline":
+		return scipy.interpolate.UnivariateSpline(ts, xs, k=3, s=0).derivative(1)(ts)
+	return derivative(xs, ts[1] - ts[0], 1, method, **options)
 
 
 def resample(ts, xs, new_dt=0.005, smooth=None, cut=None, interpolate_order=3):
@@ -0,0 +1,190 @@
+""" Monte Carlo distributions of the power law fits under the random speed profile null model.
+
+Each realization traces the same ellipse at its own band-limited random speed profile
+(simulations.simulate_ellipses) and records the CA, CV and RV betas and r2. Realizations
+are grouped into tasks that run in a process pool. Task i draws from the i-th child of
+one SeedSequence, so every realization depends only on the seed and its task, not on
+the number of workers or on which tasks ran before.
+
+Each finished task is written to <out>/task_<i>.npz, one array per column, through a
+temporary file, so an interrupted run is resumed by running it again: tasks with a file
+are skipped. <out>/run.json holds the parameters, and <out>/summary.json is rewritten
+after every task with the running count, mean, standard deviation, range and histogram
+of each column.
+
+    python monte_carlo.py -o null_model [--realizations 100000] [--task-size 1000] [--workers N] [--seed 0]
+"""
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from simulations import band_limited_speed, simulate_ellipses
+
+COLUMNS = ("betaCA", "r2CA", "betaCV", "r2CV", "betaRV", "r2RV")
+
+DEFAULT_PARAMS = {"ra": 120.0, "rb": 100.0, "freq": 1.0, "duration": 30.0, "path_dt": 0.005, "dt": 0.005,
+                  "mean_speed": 50.0, "std_speed": 5.0, "cutoff": 10.0, "rlim": None, "orthogonal": False,
+                  "batch": 50}  # rlim is None or [rmin, rmax], as everywhere else
+
+BINS = {"beta": np.linspace(-3, 3, 6001), "r2": np.linspace(0, 1, 1001)}
+
+
+def run_task(task, count, seed, params=DEFAULT_PARAMS):
+    """ columns of count realizations drawn from child task of SeedSequence(seed) """
+    params = dict(DEFAULT_PARAMS, **params)
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(task,)))
+    n = len(np.arange(0, params["duration"], params["path_dt"]))
+    columns = {name: np.empty(count) for name in COLUMNS}
+    # in batches, as each realization holds a few arrays of n samples for its kinematics
+    for start in range(0, count, params["batch"]):
+        rows = min(params["batch"], count - start)
+        speed = band_limited_speed(rows, n, params["mean_speed"], params["std_speed"], params["cutoff"],
+                                   samples_per_s=1 / params["path_dt"], rng=rng)
+        fits = simulate_ellipses(np.full(rows, params["ra"]), params["rb"], speed, params["freq"], params["duration"],
+                                 params["path_dt"], params["dt"], params["rlim"], params["orthogonal"])
+        for name in COLUMNS:
+            columns[name][start:start + rows] = fits[name]
+    return task, columns
+
+
+def task_file(out_dir, task):
+    return os.path.join(out_dir, f"task_{task:06d}.npz")
+
+
+def save_task(out_dir, task, columns):
+    tmp = os.path.join(out_dir, f".task_{task:06d}.tmp.npz")
+    np.savez(tmp, **columns)
+    os.replace(tmp, task_file(out_dir, task))
+
+
+def empty_summary():
+    summary = {}
+    for name in COLUMNS:
+        edges = BINS["beta" if name.startswith("beta") else "r2"]
+        summary[name] = {"n": 0, "mean": 0.0, "m2": 0.0, "min": np.inf, "max": -np.inf, "nan": 0,
+                         "edges": edges.tolist(), "counts": [0] * (len(edges) - 1), "below": 0, "above": 0}
+    return summary
+
+
+def update_summary(summary, columns):
+    """ adds a task's columns to the running summary (Chan et al.'s update of mean and m2) """
+    for name, values in columns.items():
+        s = summary[name]
+        finite = values[np.isfinite(values)]
+        s["nan"] += int(len(values) - len(finite))
+        if len(finite) == 0: continue
+        n, mean, m2 = len(finite), float(finite.mean()), float(np.sum((finite - finite.mean())**2))
+        total = s["n"] + n
+        delta = mean - s["mean"]
+        s["mean"] += delta * n / total
+        s["m2"] += m2 + delta**2 * s["n"] * n / total
+        s["n"] = total
+        s["min"], s["max"] = min(s["min"], float(finite.min())), max(s["max"], float(finite.max()))
+        edges = np.asarray(s["edges"])
+        s["counts"] = (np.asarray(s["counts"]) + np.histogram(finite, edges)[0]).tolist()
+        s["below"] += int(np.sum(finite < edges[0]))
+        s["above"] += int(np.sum(finite > edges[-1]))
+    return summary
+
+
+def summary_stats(summary):
+    """ count, mean, std, range and histogram quantiles of each column """
+    stats = {}
+    for name, s in summary.items():
+        counts = np.asarray(s["counts"])
+        cdf = (s["below"] + np.cumsum(counts)) / max(s["n"], 1)
+        quantiles = {f"q{q * 1000:03.0f}": float(np.interp(q, cdf, s["edges"][1:])) for q in (0.025, 0.5, 0.975)}
+        stats[name] = {"n": s["n"], "nan": s["nan"], "mean": s["mean"],
+                       "std": float(np.sqrt(s["m2"] / (s["n"] - 1))) if s["n"] > 1 else np.nan,
+                       "min": s["min"], "max": s["max"], **quantiles}
+    return stats
+
+
+def save_summary(out_dir, summary, done, tasks):
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump({"tasks_done": done, "tasks": tasks, "stats": summary_stats(summary), "histograms": summary}, f)
+
+
+def run(out_dir, realizations, task_size=1000, seed=0, workers=None, params=DEFAULT_PARAMS):
+    """ runs the tasks without a file in out_dir; returns the summary of all of them """
+    params = dict(DEFAULT_PARAMS, **params)
+    if params["rlim"] is not None: params["rlim"] = [float(r) for r in params["rlim"]]  # as read back from run.json
+    os.makedirs(out_dir, exist_ok=True)
+    config = {"realizations": realizations, "task_size": task_size, "seed": seed, "params": params}
+    config_file = os.path.join(out_dir, "run.json")
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            previous = json.load(f)
+        if previous != config:
+            raise ValueError(f"{out_dir} holds a run with other settings: {previous}")
+    else:
+        with open(config_file, "w") as f:
+            json.dump(config, f, indent=1)
+
+    counts = [min(task_size, realizations - start) for start in range(0, realizations, task_size)]
+    summary = empty_summary()
+    pending = []
+    for task in range(len(counts)):
+        if os.path.exists(task_file(out_dir, task)):
+            with np.load(task_file(out_dir, task)) as stored:
+                update_summary(summary, {name: stored[name] for name in COLUMNS})
+        else:
+            pending.append(task)
+    done = len(counts) - len(pending)
+    if done: print(f"{done} of {len(counts)} tasks already done")
+
+    def finished(task, columns):
+        nonlocal done
+        save_task(out_dir, task, columns)
+        update_summary(summary, columns)
+        done += 1
+        save_summary(out_dir, summary, done, len(counts))
+        print(f"task {task} done ({done}/{len(counts)})", flush=True)
+
+    if workers == 1:
+        for task in pending: finished(*run_task(task, counts[task], seed, params))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_task, task, counts[task], seed, params) for task in pending]
+            for future in as_completed(futures): finished(*future.result())
+    save_summary(out_dir, summary, done, len(counts))
+    return summary
+
+
+def load_results(out_dir):
+    """ the columns of all finished tasks, concatenated in task order """
+    files = sorted(glob.glob(os.path.join(out_dir, "task_*.npz")))
+    columns = {name: [] for name in COLUMNS}
+    for filename in files:
+        with np.load(filename) as stored:
+            for name in COLUMNS: columns[name].append(stored[name])
+    return {name: np.concatenate(values) if values else np.empty(0) for name, values in columns.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default="null_model", help="directory for the task files and summary")
+    parser.add_argument("--realizations", type=int, default=100000)
+    parser.add_argument("--task-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="default: number of CPUs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ra", type=float, default=DEFAULT_PARAMS["ra"])
+    parser.add_argument("--rb", type=float, default=DEFAULT_PARAMS["rb"])
+    parser.add_argument("--duration", type=float, default=DEFAULT_PARAMS["duration"])
+    parser.add_argument("--rlim", type=float, nargs=2, metavar=("RMIN", "RMAX"), default=DEFAULT_PARAMS["rlim"],
+                        help="fit only samples with RMIN < R < RMAX")
+    parser.add_argument("--orthogonal", action="store_true")
+    args = parser.parse_args()
+
+    params = dict(DEFAULT_PARAMS, ra=args.ra, rb=args.rb, duration=args.duration, rlim=args.rlim,
+                  orthogonal=args.orthogonal)
+    summary = run(args.output, args.realizations, args.task_size, args.seed, args.workers, params)
+    for name, stats in summary_stats(summary).items():
+        print(f"{name:7s} n={stats['n']} mean={stats['mean']:.4f} std={stats['std']:.4f} "
+              f"95% [{stats['q025']:.4f}, {stats['q975']:.4f}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+""" Synthetic trajectories for the power law simulations, generated and analysed in batches.
+
+A simulated trace is a path (e.g. an ellipse sampled uniformly in phase) traversed at a
+prescribed speed profile: the time of each path sample is the path length travelled so
+far divided by the speed (warp_time). Every function works on stacked rows, one row per
+trace, so a whole parameter grid (ellipse widths, eccentricities, speed profiles) is one
+call instead of one Trajectory per value:
+
+    fits = simulate_ellipses(np.arange(100, 150, 0.5), 100, rng=np.random.RandomState(152))
+    plt.plot(np.arange(100, 150, 0.5), np.sqrt(fits["r2CV"]))
+
+The kinematics are those of trajectory_analysis.Trajectory built on the warped times,
+and the fits those of Trajectory.calc_betas, with rlim = (rmin, rmax) as in the
+experiment's analysis.
+
+    python simulations.py [figure.eps]     # Pearson's r against the ellipse width
+"""
+import sys
+import numpy as np
+import scipy.interpolate as interpolate
+import scipy.signal as signal
+from util import batch_linregress, tls_regression
+
+
+def ellipses(ra, rb, freq=1.0, duration=30.0, dt=0.005, phase=0.0):
+    """ x, y rows of ellipses with semi-axes ra (along x) and rb, freq cycles per second of
+        phase time sampled every dt; ra, rb and phase broadcast to one row per ellipse """
+    ra, rb, phase = np.broadcast_arrays(*(np.atleast_1d(np.asarray(v, dtype=float)) for v in (ra, rb, phase)))
+    angle = 2 * np.pi * freq * np.arange(0, duration, dt) + phase[:, None]
+    return ra[:, None] * np.cos(angle), rb[:, None] * np.sin(angle)
+
+
+def ellipse_axes(eccentricity, ra=100.0):
+    """ semi-axes ra, rb of ellipses of the given eccentricities and semi-major axis ra """
+    eccentricity = np.asarray(eccentricity, dtype=float)
+    return np.broadcast_to(ra, eccentricity.shape), ra * np.sqrt(1 - eccentricity**2)
+
+
+def band_limited_speed(count, n, mean=50.0, std=5.0, cutoff=10.0, samples_per_s=200, filter_order=2, rng=None):
+    """ count rows of n samples of Gaussian speed noise, low-pass filtered at cutoff Hz.
+        rng is a np.random Generator or RandomState, or a seed; np.random.RandomState(152)
+        draws what np.random.seed(152) did in the notebooks. """
+    rng = rng if hasattr(rng, "normal") else np.random.default_rng(rng)
+    v = rng.normal(loc=mean, scale=std, size=(count, n))
+    B, A = signal.butter(filter_order, cutoff / (samples_per_s / 2), 'low')
+    return signal.filtfilt(B, A, v, axis=1, method="pad", padlen=5)
+
+
+def warp_time(xs, ys, speed):
+    """ times at which the path samples are reached when the step to each sample is
+        travelled at that sample's speed, starting at 0; arguments broadcast row-wise """
+    xs, ys, speed = np.broadcast_arrays(np.atleast_2d(xs), np.atleast_2d(ys), np.atleast_2d(speed))
+    t = np.zeros(xs.shape)
+    np.cumsum(np.hypot(np.diff(xs, axis=1), np.diff(ys, axis=1)) / speed[:, 1:], axis=1, out=t[:, 1:])
+    return t
+
+
+def spline_kinematics(t, xs, ys, dt=0.005, samples=None):
+    """ kinematics of each row on the uniform grid t[0] + k * dt of samples points (default:
+        as many as the row has, as in Trajectory), from the interpolating cubic spline through
+        the row's samples. A dict of (rows, samples) arrays named as Trajectory's attributes. """
+    t, xs, ys = np.broadcast_arrays(np.atleast_2d(t), np.atleast_2d(xs), np.atleast_2d(ys))
+    rows, n = t.shape
+    samples = n if samples is None else samples
+    k = {name: np.empty((rows, samples)) for name in ("t", "x", "y", "xvel", "yvel", "xacc", "yacc", "xjerk", "yjerk")}
+    # the knots differ between rows, so this is the one loop: a spline per row through x and y together
+    for i in range(rows):
+        grid = t[i, 0] + np.arange(samples) * dt
+        f = interpolate.CubicSpline(t[i], np.stack([xs[i], ys[i]], axis=1), bc_type='not-a-knot')
+        k["t"][i] = grid
+        k["x"][i], k["y"][i] = f(grid).T
+        k["xvel"][i], k["yvel"][i] = f(grid, 1).T
+        k["xacc"][i], k["yacc"][i] = f(grid, 2).T
+        k["xjerk"][i], k["yjerk"][i] = f(grid, 3).T
+    k["V"] = np.sqrt(k["xvel"]**2.0 + k["yvel"]**2.0)
+    D = np.abs(k["yacc"] * k["xvel"] - k["xacc"] * k["yvel"])
+    D[D == 0.0] = np.nan
+    k["D"] = D
+    k["R"] = (k["V"]**3.0) / D
+    k["C"] = 1.0 / k["R"]
+    k["A"] = k["V"] / k["R"]
+    k["J"] = np.sum(np.sqrt(k["xjerk"]**2 + k["yjerk"]**2), axis=1) * dt
+    return k
+
+
+def power_law_fits(k, rlim=None, orthogonal=False):
+    """ betaCA, offsetCA, r2CA, ... of each row of the kinematics k: non-finite samples and,
+        with rlim = (rmin, rmax), samples with R outside rmin < R < rmax are left out """
+    filt = np.isfinite(k["C"]) & np.isfinite(k["A"]) & np.isfinite(k["V"]) & np.isfinite(k["R"])
+    if rlim:
+        rmin, rmax = rlim
+        with np.errstate(invalid="ignore"):
+            filt = filt & (k["R"] < rmax) & (k["R"] > rmin)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = {name: np.where(filt, np.log10(k[name]), np.nan) for name in ("C", "V", "A", "R")}
+    fits = {}
+    for name, x, y in (("CA", "C", "A"), ("CV", "C", "V"), ("RV", "R", "V")):
+        beta, offset, r2 = tls_regression(logs[x], logs[y]) if orthogonal else batch_linregress(logs[x], logs[y])
+        fits["beta" + name], fits["offset" + name], fits["r2" + name] = beta, offset, r2
+    return fits
+
+
+def simulate_ellipses(ra, rb=100.0, speed=None, freq=1.0, duration=30.0, path_dt=0.005, dt=0.005, rlim=None,
+                      orthogonal=False, rng=None):
+    """ power law fits of ellipses ra x rb (broadcast to rows) traced at a speed profile; speed
+        is one row shared by all ellipses or one row each, by default one band_limited_speed
+        row drawn from rng. The path is sampled every path_dt of phase time, the kinematics
+        every dt. """
+    xs, ys = ellipses(ra, rb, freq, duration, path_dt)
+    if speed is None: speed = band_limited_speed(1, xs.shape[1], rng=rng)
+    k = spline_kinematics(warp_time(xs, ys, speed), xs, ys, dt)
+    return power_law_fits(k, rlim, orthogonal)
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+    widths = np.arange(100, 150, 0.5)
+    fits = simulate_ellipses(widths, 100, rng=np.random.RandomState(152))
+    plt.scatter(widths, np.sqrt(fits["r2CV"]), color="tab:red", label="Corr(log C, logV)")
+    plt.scatter(widths, np.sqrt(fits["r2CA"]), color="tab:blue", label="Corr(log C, logA)")
+    plt.legend()
+    plt.xlabel("Ellipse semi-major-axis ra (mm)")
+    plt.ylabel("Pearson's coef. r")
+    if len(sys.argv) > 1: plt.savefig(sys.argv[1])
+    plt.show()